@@ -2,9 +2,7 @@ import json
 import socket
 import struct
 import time
-from urllib.request import urlopen
 
-import cv2
 import requests
 
 """
@@ -14,33 +12,118 @@ import requests
 photon_id = "37002a000747333530373233"
 access_token = "724392cce6dcd72b7e1c1a9fe063a3b2726d6f6f"
 
+"""
+Forwarding parameters.
+:param host_url: The url of the Json web page hosted by jsonhost.
+:param particle_url: The url of the Photon's feedback function, point it at a local server for testing.
+:param poll_timeout: How long to wait for a new deck per request, in seconds.
+:param debounce: How long the deck has to stay the same before it is sent, in seconds.
+:param max_retries: How often to retry sending a deck before giving up on it.
+:param backoff: The delay before the first retry in seconds, doubling after every retry.
+"""
+host_url = "http://0.0.0.0:8080/"
+particle_url = "https://api.particle.io/v1/devices/{}/feedback".format(photon_id)
+poll_timeout = 20
+debounce = 1
+max_retries = 5
+backoff = .5
+
+
+def fetch_deck(session, since, timeout):
+    """
+    Waits for a deck newer than a version on the Json web page.
+    :param session: The session to the Json web page.
+    :param since: The last version seen, -1 for none.
+    :param timeout: How long to wait for a newer deck, in seconds.
+    :return: The version of the latest deck and the deck as a string.
+    """
+    response = session.get(host_url + "changes", params={"since": since, "timeout": timeout}, timeout=timeout + 10)
+    response.raise_for_status()
+    data = json.loads(response.content.decode("utf-8"))
+
+    return data["version"], data["data"]
+
+
+def wait_for_deck(session, since):
+    """
+    Waits for a new deck and then until it has not changed for the debounce time.
+    :param session: The session to the Json web page.
+    :param since: The last version seen, -1 for none.
+    :return: The version of the settled deck and the deck as a string.
+    """
+    version, data = fetch_deck(session, since, poll_timeout)
+    if version <= since:
+        return version, data
+
+    # Coalesce bursts of changes into the last one.
+    while True:
+        new_version, new_data = fetch_deck(session, version, debounce)
+        if new_version <= version:
+            return version, data
+
+        version, data = new_version, new_data
+
+
+def send_deck(session, data):
+    """
+    Sends a deck to the Photon, retrying with an increasing delay when it fails.
+    :param session: The session to the Particle API.
+    :param data: The deck as a string.
+    :return: The response of the Particle API.
+    :raises requests.RequestException: If the deck could not be sent after all retries.
+    """
+    delay = backoff
+
+    for attempt in range(max_retries + 1):
+        try:
+            response = session.post(particle_url, data={"data": data, "access_token": access_token}, timeout=10)
+            if response.status_code < 500:
+                return response
+        except requests.RequestException as e:
+            if attempt == max_retries:
+                raise
+            print("Sending failed:", e)
+
+        if attempt < max_retries:
+            time.sleep(delay)
+            delay *= 2
+
+    response.raise_for_status()
+
 
 def main():
     """
-    Sends the data from the Json page to the Photon.
+    Sends the data from the Json page to the Photon whenever the deck changes.
     """
-    url = "http://0.0.0.0:8080/"
+    host = requests.Session()
+    particle = requests.Session()
 
-    json_url = urlopen(url)
-    response = json.loads(json_url.read().decode("utf-8"))
+    version = -1
+    data = None
+    sent = None
 
-    data = {
-        "data": response["data"],
-        "access_token": access_token
-    }
+    while True:
+        # Only send decks that differ from the last one sent.
+        if data is not None and data != sent:
+            try:
+                print(send_deck(particle, data))
+                sent = data
+            except requests.RequestException as e:
+                print("Sending the deck failed:", e)
+                time.sleep(backoff)
+                continue
 
-    response = requests.post("https://api.particle.io/v1/devices/{}/feedback".format(photon_id), data=data)
-    print(response)
+        try:
+            version, data = wait_for_deck(host, version)
+        except requests.RequestException as e:
+            print("Reading the deck failed:", e)
+            time.sleep(backoff)
 
 
 if __name__ == "__main__":
     time.sleep(1)
 
-    while True:
+    try:
         main()
-
-        time.sleep(20)
-
-        key = cv2.waitKey(1) & 0xFF
-        if key == ord("q"):
-            break
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,136 @@
+import csv
+import glob
+import json
+import os
+import time
+from functools import partial
+from multiprocessing import Pool
+
+import cv2
+
+import dataset
+import finddeck
+import line
+from card import deck_to_string
+
+
+def read_image(filename, cropped=False, stored=False):
+    """
+    Reads an image, from the frame store of its directory if asked.
+    :param filename: The path of the image.
+    :param cropped: Whether the image is already cropped and thresholded, and read grey.
+    :param stored: Whether to take the image from the frame store, which has to be up to date.
+    :return: The image.
+    """
+    if not stored:
+        return cv2.imread(filename, 0 if cropped else 1)
+
+    names, frames = dataset.open_frames(os.path.dirname(filename), not cropped)
+    return frames[names.index(os.path.basename(filename))]
+
+
+def process_image(filename, cropped=False, vectorized=True, stored=False):
+    """
+    Finds the deck in an image and scores it, timing every stage.
+    :param filename: The path of the image.
+    :param cropped: Whether the image is already cropped and thresholded.
+    :param vectorized: Whether to decode all lines at once using line.get_deck_vectorized.
+    :param stored: Whether to take the image from the frame store of its directory.
+    :return: A dict containing the name, deck, accuracy and timings of the image.
+    """
+    result = {"name": os.path.basename(filename), "deck": "", "accuracy": 0.0, "error": ""}
+    timings = {}
+
+    start = time.perf_counter()
+    image = read_image(filename, cropped, stored)
+    timings["read"] = time.perf_counter() - start
+
+    try:
+        if not cropped:
+            start = time.perf_counter()
+            _, _, _, box = finddeck.compute_bounds(image)
+            timings["bounds"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            image = finddeck.crop_deck(image, box)
+            timings["crop"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        deck = line.get_filtered_deck(image, vectorized)
+        timings["decode"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result["accuracy"] = line.accuracy_score(deck)
+        timings["score"] = time.perf_counter() - start
+
+        result["deck"] = deck_to_string(deck)
+    except (IndexError, TypeError, ValueError, cv2.error) as e:
+        # The deck could not be found in this image.
+        result["error"] = repr(e)
+
+    timings["total"] = sum(timings.values())
+    result.update({"time_" + stage: seconds for stage, seconds in timings.items()})
+
+    return result
+
+
+def write_report(results, path):
+    """
+    Writes the results to a report file.
+    :param results: The results of process_image.
+    :param path: The path of the report, written as Json if it ends in .json and as CSV otherwise.
+    """
+    if path.endswith(".json"):
+        with open(path, "w") as f:
+            json.dump(results, f, indent=2)
+        return
+
+    fields = []
+    for result in results:
+        fields += [field for field in result if field not in fields]
+
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def main(directory="Images_Ordered", report="report.csv", cropped=False, vectorized=True, workers=None, stored=True):
+    """
+    Finds and scores the decks of all images in a directory using all cores, without showing any images.
+    Results are printed as they complete and written to a report afterwards.
+    :param directory: The directory containing the png images.
+    :param report: The path of the report, written as Json if it ends in .json and as CSV otherwise.
+    :param cropped: Whether the images are already cropped and thresholded, as in Images_Ordered_Cropped.
+    :param vectorized: Whether to decode all lines at once using line.get_deck_vectorized.
+    :param workers: The number of processes to use, defaults to the number of cores.
+    :param stored: Whether to read the images from the frame store of the directory, made or updated first.
+    :return: The results of all images, ordered by name.
+    """
+    files = sorted(glob.glob(os.path.join(directory, "*.png")))
+    if stored:
+        dataset.update_frame_store(directory, not cropped)
+
+    task = partial(process_image, cropped=cropped, vectorized=vectorized, stored=stored)
+    results = []
+
+    start = time.perf_counter()
+    with Pool(workers) as pool:
+        for result in pool.imap_unordered(task, files):
+            results.append(result)
+            print("{}: {:.2f}% in {:.3f}s {}".format(
+                result["name"], result["accuracy"], result["time_total"], result["error"]))
+
+    elapsed = time.perf_counter() - start
+    results.sort(key=lambda r: r["name"])
+    write_report(results, report)
+
+    if results:
+        print("Average score:", sum(r["accuracy"] for r in results) / len(results))
+    print("Processed {} images in {:.2f}s".format(len(results), elapsed))
+
+    return results
+
+
+if __name__ == "__main__":
+    main()
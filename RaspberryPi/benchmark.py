@@ -0,0 +1,227 @@
+import json
+import resource
+import subprocess
+import time
+import tracemalloc
+from functools import wraps
+
+import cv2
+import numpy as np
+
+import dataset
+import finddeck
+import line
+
+"""
+Benchmark parameters.
+:param stages: The functions that are timed, as (module, function name).
+:param tolerance: How much slower than the baseline a stage may be before it is flagged as a regression.
+"""
+stages = [
+    (finddeck, "good_features"),
+    (finddeck, "remove_outliers"),
+    (finddeck, "bounding_box_constrained"),
+    (finddeck, "crop_deck"),
+    (line, "get_deck"),
+    (line, "get_deck_vectorized"),
+    (line, "lookup_card"),
+]
+tolerance = .1
+
+
+def timed(function, totals):
+    """
+    Wraps a function such that the time spent in it is added to a running total.
+    :param function: The function to time.
+    :param totals: A dict mapping function names to the seconds spent in them during the current frame.
+    :return: The wrapped function.
+    """
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            totals[function.__name__] = totals.get(function.__name__, 0) + time.perf_counter() - start
+
+    return wrapper
+
+
+def summarise(samples):
+    """
+    Summarises the latencies of a stage.
+    :param samples: The seconds spent in the stage for each frame.
+    :return: A dict containing the number of samples and the mean, p50, p95 and max latency in milliseconds.
+    """
+    samples = np.array(samples) * 1000
+    return {
+        "count": len(samples),
+        "mean": float(samples.mean()),
+        "p50": float(np.percentile(samples, 50)),
+        "p95": float(np.percentile(samples, 95)),
+        "max": float(samples.max()),
+    }
+
+
+def git_commit():
+    """
+    Gets the commit the benchmark runs on.
+    :return: The hash of the current commit, or None if it is unknown.
+    """
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def process_frame(image, vectorized=False):
+    """
+    Runs the full pipeline on one frame.
+    :param image: The frame to find the deck of.
+    :param vectorized: Whether to decode all lines at once using line.get_deck_vectorized.
+    :return: The found deck.
+    """
+    _, _, _, box = finddeck.compute_bounds(image)
+    cropped = finddeck.crop_deck(image, box)
+    return line.get_filtered_deck(cropped, vectorized)
+
+
+def measure_memory(images, vectorized=False):
+    """
+    Measures the peak memory the pipeline allocates per frame, in a separate pass so tracing does not slow the timings.
+    Only allocations visible to tracemalloc are counted, which includes NumPy arrays and the arrays OpenCV returns
+    but not the temporary buffers OpenCV uses internally. The frames themselves are not counted.
+    :param images: The images to find the decks of.
+    :param vectorized: Whether to decode all lines at once using line.get_deck_vectorized.
+    :return: A dict containing the p50 and max peak memory per frame in kilobytes, or None if no frame succeeded.
+    """
+    peaks = []
+
+    for image in images:
+        # Restarting forgets the peak of the previous frame.
+        tracemalloc.start()
+        try:
+            process_frame(image, vectorized)
+            peaks.append(tracemalloc.get_traced_memory()[1] / 1024)
+        except (IndexError, TypeError, ValueError, cv2.error):
+            pass
+        finally:
+            tracemalloc.stop()
+
+    if not peaks:
+        return None
+
+    return {"p50": float(np.percentile(peaks, 50)), "max": float(max(peaks))}
+
+
+def run(images, vectorized=False):
+    """
+    Runs the full pipeline on the images, timing every stage.
+    :param images: The images to find the decks of.
+    :param vectorized: Whether to decode all lines at once using line.get_deck_vectorized.
+    :return: The benchmark results.
+    """
+    totals = {}
+    originals = [(module, name, getattr(module, name)) for module, name in stages]
+    for module, name, function in originals:
+        setattr(module, name, timed(function, totals))
+
+    samples = {}
+    dropped = 0
+    start = time.perf_counter()
+
+    try:
+        for image in images:
+            totals.clear()
+            frame_start = time.perf_counter()
+
+            try:
+                process_frame(image, vectorized)
+            except (IndexError, TypeError, ValueError, cv2.error):
+                dropped += 1
+                continue
+
+            totals["frame"] = time.perf_counter() - frame_start
+            for name, seconds in totals.items():
+                samples.setdefault(name, []).append(seconds)
+    finally:
+        for module, name, function in originals:
+            setattr(module, name, function)
+
+    elapsed = time.perf_counter() - start
+
+    return {
+        "commit": git_commit(),
+        "frames": len(images),
+        "dropped": dropped,
+        "vectorized": vectorized,
+        "fps": len(images) / elapsed if elapsed > 0 else 0.0,
+        "frame_memory_kb": measure_memory(images, vectorized),
+        # Maximum resident set size of the whole process in kilobytes on Linux, which includes the loaded frames.
+        "process_memory_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "stages": {name: summarise(seconds) for name, seconds in samples.items()},
+    }
+
+
+def compare(results, baseline):
+    """
+    Compares benchmark results to a baseline.
+    :param results: The new benchmark results.
+    :param baseline: The baseline benchmark results.
+    :return: A list of regression messages, empty if no stage got slower than the tolerance allows.
+    """
+    regressions = []
+
+    for name, stats in results["stages"].items():
+        if name not in baseline["stages"]:
+            continue
+
+        old = baseline["stages"][name]["p50"]
+        new = stats["p50"]
+        if new > old * (1 + tolerance):
+            regressions.append("{}: p50 {:.3f}ms -> {:.3f}ms (+{:.0f}%)".format(name, old, new, (new / old - 1) * 100))
+
+    if results["fps"] < baseline["fps"] * (1 - tolerance):
+        regressions.append("fps: {:.2f} -> {:.2f}".format(baseline["fps"], results["fps"]))
+
+    return regressions
+
+
+def main(directory="Images_Ordered", output="benchmark.json", baseline=None, vectorized=False, limit=None):
+    """
+    Benchmarks the full pipeline on the images in a directory and saves the results.
+    :param directory: The directory containing the png images.
+    :param output: The path of the Json file to save the results to.
+    :param baseline: The path of earlier saved results to compare to, if any.
+    :param vectorized: Whether to decode all lines at once using line.get_deck_vectorized.
+    :param limit: The maximum number of images to use, all if None.
+    :return: The benchmark results and a list of regressions compared to the baseline.
+    """
+    _, images = dataset.load_frames(directory)
+    images = images[:limit]
+
+    results = run(images, vectorized)
+
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    print("Frames: {}, dropped: {}, fps: {:.2f}, process memory: {} kB".format(
+        results["frames"], results["dropped"], results["fps"], results["process_memory_kb"]))
+    if results["frame_memory_kb"] is not None:
+        print("Memory per frame: p50 {p50:.0f} kB, max {max:.0f} kB".format(**results["frame_memory_kb"]))
+    for name, stats in results["stages"].items():
+        print("{:>26}: p50 {p50:8.3f}ms, p95 {p95:8.3f}ms, max {max:8.3f}ms".format(name, **stats))
+
+    regressions = []
+    if baseline is not None:
+        with open(baseline, "r") as f:
+            regressions = compare(results, json.load(f))
+
+        for regression in regressions:
+            print("Regression:", regression)
+
+    return results, regressions
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,13 @@
 import warnings
 
-import math
+import numpy as np
 
 from code import Code
 
 
 class Card:
+    __slots__ = ["rank", "suit"]
+
     ranks = ["ace", "2", "3", "4", "5", "6", "7", "8", "9", "10", "jack", "queen", "king"]
     suits = ["hearts", "spades", "diamonds", "clubs"]
 
@@ -21,6 +23,24 @@ class Card:
         self.rank = rank
         self.suit = suit
 
+    @classmethod
+    def from_index(cls, index):
+        """
+        Gets a card from the table of all cards, without creating a new card.
+        :param index: The index of the card, suit * 13 + rank.
+        :return: The card at the index.
+        """
+        assert 0 <= index < 52, "Card index out of range."
+        return cards[index]
+
+    @property
+    def index(self):
+        """
+        Gets the index of this card, ordered by suit and then by rank.
+        :return: The index of this card, suit * 13 + rank.
+        """
+        return self.suit * 13 + self.rank
+
     def __lt__(self, other):
         """
         Checks if this card is lower than another card.
@@ -42,6 +62,13 @@ class Card:
         """
         return self.rank == other.rank and self.suit == other.suit
 
+    def __hash__(self):
+        """
+        Hashes this card.
+        :return: The index of this card.
+        """
+        return self.suit * 13 + self.rank
+
     def __str__(self):
         """
         Turns this card into a string.
@@ -50,6 +77,13 @@ class Card:
         return "{} of {}".format(self.ranks[self.rank], self.suits[self.suit])
 
 
+"""
+All 52 cards, ordered by suit and then by rank.
+These are shared so that no new cards have to be created while decoding.
+"""
+cards = [Card(number % 13, number // 13) for number in range(52)]
+
+
 def deck_to_string(deck):
     """
     Turns a deck into a single bitstring of the form xx (repeating),
@@ -57,7 +91,7 @@ def deck_to_string(deck):
     :param deck: The deck.
     :return: A bitstring representing the deck.
     """
-    return "".join(["{:02d}".format(card.suit * 13 + card.rank) for card in deck])
+    return "".join(["{:02d}".format(card.index) for card in deck])
 
 
 def string_to_deck(s):
@@ -76,7 +110,67 @@ def number_to_card(number):
     :return: The card corresponding to the number.
     """
     assert 0 <= number < 52, "Card number out of range."
-    return Card(number % 13, int(math.floor((number - (number % 13)) / 13)))
+    return Card.from_index(number)
+
+
+"""
+Previous version codes of all cards, ordered by suit and then by rank.
+"""
+codes_old = [
+    "01 01 01 01", "11 01 01 01", "01 11 01 01", "01 11 11 01",
+    "01 01 01 11", "11 11 01 01", "11 01 11 01", "11 01 01 11",
+    "01 01 11 01", "01 11 01 11", "01 01 11 11", "01 11 11 11",
+    "11 01 11 11",
+
+    "10 11 11 11", "11 10 11 11", "11 11 10 11", "11 11 11 10",
+    "11 11 11 11", "10 01 01 01", "01 10 01 01", "01 01 10 01",
+    "01 01 01 10", "10 10 01 01", "10 01 10 01", "10 01 01 10",
+    "01 10 10 01",
+
+    "01 10 11 11", "01 01 10 10", "01 10 10 10", "10 01 10 10",
+    "10 10 01 10", "10 10 10 01", "10 11 01 01", "10 01 11 01",
+    "10 01 01 11", "11 10 01 01", "01 10 11 01", "01 10 01 11",
+    "11 01 10 01",
+
+    "11 11 01 11", "11 11 11 01", "10 10 10 10", "11 10 10 10",
+    "10 11 10 10", "10 10 11 10", "10 10 10 11", "11 11 10 10",
+    "11 10 11 10", "11 10 10 11", "10 11 11 10", "10 11 10 11",
+    "10 10 11 11",
+]
+
+
+def pack_code(code):
+    """
+    Packs a code into a single 8-bit number.
+    :param code: An enum array of codes, or a bitstring of the form xx xx xx xx.
+    :return: The code as a number between 0 and 256 (excluding).
+    """
+    return int("".join(code).replace(" ", ""), 2)
+
+
+def build_card_table(codes):
+    """
+    Builds a table that maps every packed code to its card.
+    :param codes: The codes of all cards, ordered by suit and then by rank.
+    :return: An array of 256 entries containing the card of each packed code, or None if no card has that code.
+    """
+    table = 256 * [None]
+
+    for number, code in enumerate(codes):
+        # The first card with a code wins, as when searching in order.
+        if table[code.value] is None:
+            table[code.value] = number_to_card(number)
+
+    return table
+
+
+def build_symbol_table(codes):
+    """
+    Builds a table with the symbols of every code, as indices in symbols.
+    :param codes: The codes of all cards, ordered by suit and then by rank.
+    :return: An array with a row of four symbol indices per card.
+    """
+    return np.array([[symbols.index(symbol) for symbol in str(code).split()] for code in codes])
 
 
 def get_card(code):
@@ -85,12 +179,7 @@ def get_card(code):
     :param code: An enum array of codes.
     :return: The card corresponding to the code.
     """
-    bitstring = " ".join([c for c in code])
-
-    for suit in range(4):
-        for rank in range(13):
-            if bitstring == str(Code.from_card(rank, suit)):
-                return Card(rank, suit)
+    return card_table[pack_code(code)]
 
 
 def get_card_old(code):
@@ -101,62 +190,22 @@ def get_card_old(code):
     """
     warnings.warn("Deprecated, use get_card instead with the new codes.", DeprecationWarning)
 
-    bitstring = " ".join([c for c in code])
-
-    if bitstring == "01 01 01 01": return Card(0, 0)
-    if bitstring == "11 01 01 01": return Card(1, 0)
-    if bitstring == "01 11 01 01": return Card(2, 0)
-    if bitstring == "01 11 11 01": return Card(3, 0)
-    if bitstring == "01 01 01 11": return Card(4, 0)
-    if bitstring == "11 11 01 01": return Card(5, 0)
-    if bitstring == "11 01 11 01": return Card(6, 0)
-    if bitstring == "11 01 01 11": return Card(7, 0)
-    if bitstring == "01 01 11 01": return Card(8, 0)
-    if bitstring == "01 11 01 11": return Card(9, 0)
-    if bitstring == "01 01 11 11": return Card(10, 0)
-    if bitstring == "01 11 11 11": return Card(11, 0)
-    if bitstring == "11 01 11 11": return Card(12, 0)
-
-    if bitstring == "10 11 11 11": return Card(0, 1)
-    if bitstring == "11 10 11 11": return Card(1, 1)
-    if bitstring == "11 11 10 11": return Card(2, 1)
-    if bitstring == "11 11 11 10": return Card(3, 1)
-    if bitstring == "11 11 11 11": return Card(4, 1)
-    if bitstring == "10 01 01 01": return Card(5, 1)
-    if bitstring == "01 10 01 01": return Card(6, 1)
-    if bitstring == "01 01 10 01": return Card(7, 1)
-    if bitstring == "01 01 01 10": return Card(8, 1)
-    if bitstring == "10 10 01 01": return Card(9, 1)
-    if bitstring == "10 01 10 01": return Card(10, 1)
-    if bitstring == "10 01 01 10": return Card(11, 1)
-    if bitstring == "01 10 10 01": return Card(12, 1)
-
-    if bitstring == "01 10 11 11": return Card(0, 2)
-    if bitstring == "01 01 10 10": return Card(1, 2)
-    if bitstring == "01 10 10 10": return Card(2, 2)
-    if bitstring == "10 01 10 10": return Card(3, 2)
-    if bitstring == "10 10 01 10": return Card(4, 2)
-    if bitstring == "10 10 10 01": return Card(5, 2)
-    if bitstring == "10 11 01 01": return Card(6, 2)
-    if bitstring == "10 01 11 01": return Card(7, 2)
-    if bitstring == "10 01 01 11": return Card(8, 2)
-    if bitstring == "11 10 01 01": return Card(9, 2)
-    if bitstring == "01 10 11 01": return Card(10, 2)
-    if bitstring == "01 10 01 11": return Card(11, 2)
-    if bitstring == "11 01 10 01": return Card(12, 2)
-
-    if bitstring == "11 11 01 11": return Card(0, 3)
-    if bitstring == "11 11 11 01": return Card(1, 3)
-    if bitstring == "10 10 10 10": return Card(2, 3)
-    if bitstring == "11 10 10 10": return Card(3, 3)
-    if bitstring == "10 11 10 10": return Card(4, 3)
-    if bitstring == "10 10 11 10": return Card(5, 3)
-    if bitstring == "10 10 10 11": return Card(6, 3)
-    if bitstring == "11 11 10 10": return Card(7, 3)
-    if bitstring == "11 10 11 10": return Card(8, 3)
-    if bitstring == "11 10 10 11": return Card(9, 3)
-    if bitstring == "10 11 11 10": return Card(10, 3)
-    if bitstring == "10 11 10 11": return Card(11, 3)
-    if bitstring == "10 10 11 11": return Card(12, 3)
-
-    raise LookupError("Could not find card with code {}.".format(bitstring))
+    card = card_table_old[pack_code(code)]
+    if card is None:
+        raise LookupError("Could not find card with code {}.".format(" ".join(code)))
+
+    return card
+
+
+"""
+The symbols a part of a code can be decoded as.
+"""
+symbols = ["01", "10", "11"]
+
+"""
+Lookup tables from packed codes to cards, built once for both code versions,
+and the symbol table used to correct misread previous version codes.
+"""
+card_table = build_card_table([Code.from_card(number % 13, number // 13) for number in range(52)])
+card_table_old = build_card_table([Code(bitstring) for bitstring in codes_old])
+symbol_table_old = build_symbol_table([Code(bitstring) for bitstring in codes_old])
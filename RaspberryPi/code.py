@@ -1,10 +1,18 @@
 class Code:
+    __slots__ = ["value"]
+
     def __init__(self, bitstring):
         """
         Initialises this code.
-        :param bitstring: The bitstring to turn into a code.
+        :param bitstring: The bitstring to turn into a code, or the code packed into an 8-bit number.
         """
-        self.bits = [int(bit) for bit in bitstring.replace(" ", "")]
+        if isinstance(bitstring, int):
+            assert 0 <= bitstring < 256, "Code value out of range."
+            self.value = bitstring
+        elif bitstring in values:
+            self.value = values[bitstring]
+        else:
+            self.value = int(bitstring.replace(" ", ""), 2)
 
     @classmethod
     def from_card(cls, rank, suit):
@@ -17,52 +25,67 @@ class Code:
         assert 0 <= rank < 13, "Rank index out of range."
         assert 0 <= suit < 4, "Suit index out of range."
 
-        return cls(str(cls.from_rank(rank) + cls.from_suit(suit)))
+        return cls.from_rank(rank) + cls.from_suit(suit)
 
     @classmethod
     def from_rank(cls, rank):
         """
         Turns a rank into a code.
+        Every bit of the rank becomes a pair of bits, 10 for a one and 01 for a zero.
         :param rank: The rank to get the code from.
         :return: A code corresponding to the rank.
         """
         assert 0 <= rank < 13, "Rank index out of range."
-        return cls("".join(["01" if rank % 2 ** i < 2 ** i / 2 else "10" for i in range(4, 0, -1)]))
+        return cls(sum((0b10 if rank >> i & 1 else 0b01) << 2 * i for i in range(4)))
 
     @classmethod
     def from_suit(cls, suit):
         """
         Turns a suit into a code.
+        The lowest suit + 1 pairs of bits are 01, the others 00.
         :param suit: The suit to get the code from.
         :return: A code corresponding to the suit.
         """
         assert 0 <= suit < 4, "Suit index out of range."
-        return cls("".join(["01" if suit >= i else "00" for i in range(3, -1, -1)]))
+        return cls(sum(0b01 << 2 * i for i in range(suit + 1)))
 
     def __add__(self, other):
         """
         Adds two codes.
+        Each bit is the sum of both bits, plus a carry if both bits to its right are set.
         :param other: The other code.
         :return: The addition of this code and the other code.
         """
-        bits = 8 * [int]
+        return Code((self.value ^ other.value ^ ((self.value & other.value) << 1)) & 0xFF)
 
-        for i in range(8):
-            if i == 7:
-                bits[7] = (self.bits[7] + other.bits[7]) % 2
-            elif self.bits[i + 1] + other.bits[i + 1] == 2:
-                bits[i] = (self.bits[i] + other.bits[i] + 1) % 2
-            else:
-                bits[i] = (self.bits[i] + other.bits[i]) % 2
+    def __eq__(self, other):
+        """
+        Checks if this code is equal to another code.
+        :param other: The code to compare this code to.
+        :return: True if all bits are the same.
+        """
+        return isinstance(other, Code) and self.value == other.value
 
-        return Code("".join([str(b) for b in bits]))
+    def __hash__(self):
+        """
+        Hashes this code.
+        :return: The packed value of this code.
+        """
+        return self.value
 
     def __str__(self):
         """
         Turns this code into a string.
         :return: This code as a string.
         """
-        return " ".join([str(self.bits[i]) + str(self.bits[i + 1]) for i in range(0, 8, 2)])
+        return bitstrings[self.value]
+
+
+"""
+Conversion tables between packed codes and their strings of the form xx xx xx xx.
+"""
+bitstrings = [" ".join("{:08b}".format(value)[i:i + 2] for i in range(0, 8, 2)) for value in range(256)]
+values = {bitstring: value for value, bitstring in enumerate(bitstrings)}
 
 
 def main():
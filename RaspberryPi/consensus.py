@@ -0,0 +1,81 @@
+import numpy as np
+
+from card import cards
+
+"""
+Consensus parameters.
+:param window: The number of most recent frames that vote on the deck.
+:param min_confidence: The fraction of the frames in the window a card has to be found in to be part of the deck.
+"""
+window = 15
+min_confidence = .2
+
+
+class Consensus:
+    def __init__(self, size=window, threshold=min_confidence):
+        """
+        Initialises an empty consensus over a sliding window of frames.
+        Every frame votes for the cards it found and for where they are in the deck. Cards are placed by their
+        average relative position, so a card missed in one frame does not shift the cards behind it.
+        :param size: The number of most recent frames that vote.
+        :param threshold: The fraction of the frames in the window a card has to be found in.
+        """
+        self.size = size
+        self.threshold = threshold
+
+        # Ring buffer of the votes of every frame in the window, and their sums.
+        self.seen = np.zeros((size, 52), dtype=np.int32)
+        self.positions = np.zeros((size, 52))
+        self.votes = np.zeros(52, dtype=np.int32)
+        self.position_sums = np.zeros(52)
+        self.frames = 0
+
+        self.deck = []
+        self.confidence = []
+
+    def add(self, deck):
+        """
+        Adds the votes of a frame, replacing the votes of the oldest frame once the window is full.
+        :param deck: The deck found in the frame.
+        """
+        slot = self.frames % self.size
+        self.votes -= self.seen[slot]
+        self.position_sums -= self.positions[slot]
+        self.seen[slot] = 0
+        self.positions[slot] = 0
+
+        if deck:
+            # Cards found more than once vote for their first position.
+            indices, first = np.unique([card.index for card in deck], return_index=True)
+            self.seen[slot, indices] = 1
+            self.positions[slot, indices] = first / len(deck)
+
+        self.votes += self.seen[slot]
+        self.position_sums += self.positions[slot]
+        self.frames += 1
+
+    def update(self, deck):
+        """
+        Adds a frame and recomputes the consensus deck.
+        :param deck: The deck found in the frame.
+        :return: Whether the consensus deck changed.
+        """
+        self.add(deck)
+
+        confidence = self.votes / min(self.frames, self.size)
+        keep = np.flatnonzero((confidence >= self.threshold) & (self.votes > 0))
+        order = keep[np.argsort(self.position_sums[keep] / self.votes[keep], kind="stable")]
+
+        deck = [cards[i] for i in order]
+        changed = deck != self.deck
+
+        self.deck = deck
+        self.confidence = confidence[order].tolist()
+
+        return changed
+
+    def reset(self):
+        """
+        Forgets all frames, as when a different deck is shown.
+        """
+        self.__init__(self.size, self.threshold)
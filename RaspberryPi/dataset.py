@@ -0,0 +1,214 @@
+import glob
+import hashlib
+import json
+import os
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+
+def pack_directory(directory="Images_Ordered_Cropped", path="Images_Ordered_Cropped.npz"):
+    """
+    Packs all cropped and thresholded deck images in a directory into one archive, using one bit per pixel.
+    :param directory: The directory containing the png images.
+    :param path: The path of the archive to write.
+    :return: The number of packed images.
+    """
+    files = sorted(glob.glob(os.path.join(directory, "*.png")))
+    images = [cv2.imread(filename, 0) for filename in files]
+    packed = np.stack([np.packbits(image > 127, axis=1) for image in images])
+
+    np.savez(path,
+             names=np.array([os.path.basename(filename) for filename in files]),
+             packed=packed,
+             width=images[0].shape[1])
+
+    return len(images)
+
+
+def load_packed(path="Images_Ordered_Cropped.npz"):
+    """
+    Loads an archive written by pack_directory.
+    :param path: The path of the archive.
+    :return: The names of the images, the packed images as one array and the width of the unpacked images.
+    """
+    with np.load(path) as archive:
+        return list(archive["names"]), archive["packed"], int(archive["width"])
+
+
+def unpack(packed, width):
+    """
+    Unpacks a bit packed deck image.
+    :param packed: The image packed along its rows.
+    :param width: The width of the unpacked image.
+    :return: The image, with 255 for white and 0 for black.
+    """
+    return np.unpackbits(packed, axis=-1)[..., :width] * np.uint8(255)
+
+
+def store_paths(directory, color=True):
+    """
+    Gets the paths of the frame store of a directory, kept next to the directory.
+    :param directory: The directory containing the png images.
+    :param color: Whether the store holds BGR frames or grey frames.
+    :return: The path of the frames and the path of their index.
+    """
+    base = os.path.normpath(directory) + ("" if color else "_gray")
+    return base + ".frames.npy", base + ".frames.json"
+
+
+def file_state(filename):
+    """
+    Gets the modification time and size of a file, to cheaply notice changes.
+    :param filename: The path of the file.
+    :return: The modification time in nanoseconds and the size in bytes.
+    """
+    stat = os.stat(filename)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def file_hash(filename):
+    """
+    Hashes the contents of a file.
+    :param filename: The path of the file.
+    :return: The hex digest of the contents.
+    """
+    with open(filename, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def read_frame(filename, color, shape=None):
+    """
+    Reads an image for the frame store.
+    :param filename: The path of the image.
+    :param color: Whether to read a BGR frame or a grey frame.
+    :param shape: The shape of the frames in the store, if known.
+    :return: The image.
+    :raises ValueError: If the image cannot be read or does not have the shape of the store.
+    """
+    image = cv2.imread(filename, 1 if color else 0)
+    if image is None:
+        raise ValueError("Could not read {}.".format(filename))
+    if shape is not None and image.shape != tuple(shape):
+        raise ValueError("{} has shape {}, the frame store holds {}.".format(filename, image.shape, tuple(shape)))
+
+    return image
+
+
+def build_frame_store(directory="Images_Ordered", color=True):
+    """
+    Converts all png images in a directory into one raw array on disk that can be memory mapped.
+    All images need to have the same size.
+    :param directory: The directory containing the png images.
+    :param color: Whether to store BGR frames or grey frames.
+    :return: The index of the store.
+    """
+    frames_path, index_path = store_paths(directory, color)
+    files = sorted(glob.glob(os.path.join(directory, "*.png")))
+    if not files:
+        raise ValueError("No png images in {}.".format(directory))
+
+    first = read_frame(files[0], color)
+    # Write next to the old store and swap it in, processes that still map the old store keep reading it.
+    frames = np.lib.format.open_memmap(frames_path + ".tmp", mode="w+", dtype=np.uint8,
+                                       shape=(len(files),) + first.shape)
+    for i, filename in enumerate(files):
+        frames[i] = read_frame(filename, color, first.shape)
+    frames.flush()
+    del frames
+    os.replace(frames_path + ".tmp", frames_path)
+
+    index = {"names": [os.path.basename(filename) for filename in files],
+             "states": [file_state(filename) for filename in files],
+             "hashes": [file_hash(filename) for filename in files]}
+    write_index(index_path, index)
+
+    return index
+
+
+def write_index(path, index):
+    """
+    Writes the index of a frame store, replacing the old one at once.
+    :param path: The path of the index.
+    :param index: The index.
+    """
+    with open(path + ".tmp", "w") as f:
+        json.dump(index, f)
+    os.replace(path + ".tmp", path)
+
+
+def update_frame_store(directory="Images_Ordered", color=True):
+    """
+    Makes sure the frame store of a directory matches its png images. Images that were added or removed
+    rebuild the store, images with a new modification time or size are hashed and only rewritten when changed.
+    :param directory: The directory containing the png images.
+    :param color: Whether the store holds BGR frames or grey frames.
+    :return: Whether the store was changed.
+    """
+    frames_path, index_path = store_paths(directory, color)
+    files = sorted(glob.glob(os.path.join(directory, "*.png")))
+    names = [os.path.basename(filename) for filename in files]
+
+    try:
+        with open(index_path) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = None
+
+    if index is None or index["names"] != names or not os.path.exists(frames_path):
+        build_frame_store(directory, color)
+        return True
+
+    stale = [i for i, filename in enumerate(files) if file_state(filename) != index["states"][i]]
+    if not stale:
+        return False
+
+    frames = np.load(frames_path, mmap_mode="r+")
+    changed = False
+    for i in stale:
+        digest = file_hash(files[i])
+        if digest != index["hashes"][i]:
+            frames[i] = read_frame(files[i], color, frames.shape[1:])
+            index["hashes"][i] = digest
+            changed = True
+        index["states"][i] = file_state(files[i])
+    frames.flush()
+    del frames
+
+    write_index(index_path, index)
+
+    return changed
+
+
+@lru_cache(maxsize=None)
+def open_frames(directory="Images_Ordered", color=True):
+    """
+    Memory maps the frame store of a directory without checking it, as done once per process.
+    :param directory: The directory containing the png images.
+    :param color: Whether the store holds BGR frames or grey frames.
+    :return: The names of the images and the read only frames, indexing gives views without copying.
+    """
+    frames_path, index_path = store_paths(directory, color)
+    with open(index_path) as f:
+        names = json.load(f)["names"]
+
+    return names, np.load(frames_path, mmap_mode="r")
+
+
+def load_frames(directory="Images_Ordered", color=True):
+    """
+    Loads all images of a directory from its frame store, creating or updating the store first when needed.
+    :param directory: The directory containing the png images.
+    :param color: Whether to load BGR frames or grey frames.
+    :return: The names of the images and the read only frames, indexing gives views without copying.
+    """
+    if update_frame_store(directory, color):
+        open_frames.cache_clear()
+
+    return open_frames(directory, color)
+
+
+if __name__ == "__main__":
+    print("Packed {} images.".format(pack_directory()))
+    print("Stored {} frames.".format(len(load_frames()[0])))
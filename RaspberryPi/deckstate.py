@@ -0,0 +1,102 @@
+import mmap
+import os
+import struct
+import tempfile
+import time
+
+"""
+Deck state parameters.
+:param path: The file backing the shared memory, on a RAM disk when available so nothing is written to the SD card.
+:param size: The size of the shared memory in bytes.
+:param retries: How often to retry reading while the data is being written.
+"""
+path = os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "deckstate")
+size = 4096
+retries = 1000
+
+"""
+Statistics state parameters, the instrumentation of livefeed is shared with jsonhost in the same way as the deck.
+:param stats_path: The file backing the shared memory of the statistics.
+:param stats_size: The size of the shared memory of the statistics in bytes.
+"""
+stats_path = path + "-stats"
+stats_size = 65536
+
+"""
+Layout of the shared memory: a sequence number and the length of the data, followed by the data.
+The sequence number is odd while the data is being written.
+"""
+header = struct.Struct("<QI")
+
+
+class DeckState:
+    def __init__(self, state_path=None, state_size=None):
+        """
+        Opens the shared deck state, creating it if it does not exist yet.
+        :param state_path: The file backing the shared memory, defaults to path.
+        :param state_size: The size of the shared memory in bytes, defaults to size.
+        """
+        self.path = state_path or path
+        self.size = state_size or size
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size < self.size:
+                os.ftruncate(fd, self.size)
+            self.memory = mmap.mmap(fd, self.size)
+        finally:
+            os.close(fd)
+
+    def close(self):
+        """
+        Closes the shared memory, leaving its contents for other processes.
+        """
+        self.memory.close()
+
+    def sequence(self):
+        """
+        Gets the current sequence number.
+        :return: The sequence number, odd while a write is in progress.
+        """
+        return header.unpack_from(self.memory, 0)[0]
+
+    def publish(self, data):
+        """
+        Replaces the published data, readers see either the old or the new data as a whole.
+        Data equal to the published data is not written again, so the version only changes with the data.
+        Only one process may publish.
+        :param data: The string to publish.
+        :return: Whether the data was written.
+        """
+        encoded = data.encode("ascii")
+        assert len(encoded) <= self.size - header.size, "Data does not fit in the deck state."
+
+        seq, length = header.unpack_from(self.memory, 0)
+        if seq % 2 == 1:
+            # A previous writer stopped halfway.
+            seq += 1
+        elif length == len(encoded) and self.memory[header.size:header.size + length] == encoded:
+            return False
+
+        header.pack_into(self.memory, 0, seq + 1, 0)
+        self.memory[header.size:header.size + len(encoded)] = encoded
+        header.pack_into(self.memory, 0, seq + 2, len(encoded))
+
+        return True
+
+    def read(self):
+        """
+        Reads the published data.
+        :return: The version of the data, which increases with every publish, and the data itself.
+        """
+        for _ in range(retries):
+            seq, length = header.unpack_from(self.memory, 0)
+            if seq % 2 == 0:
+                data = self.memory[header.size:header.size + length]
+                if self.sequence() == seq:
+                    return seq // 2, data.decode("ascii")
+
+            # A write is in progress.
+            time.sleep(0)
+
+        raise RuntimeError("Deck state is not consistent, the publisher may have stopped while writing.")
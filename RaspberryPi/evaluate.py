@@ -0,0 +1,178 @@
+import numpy as np
+
+import dataset
+import line
+import synthetic
+
+"""
+The order of a deck that is sorted by suit and then by rank, as in Images_Ordered.
+"""
+ordered = np.arange(52)
+
+
+def to_indices(deck):
+    """
+    Turns a deck into an array of card indices.
+    :param deck: A deck of cards, or of card indices.
+    :return: The indices of the cards.
+    """
+    return np.array([card if isinstance(card, (int, np.integer)) else card.index for card in deck], dtype=np.int64)
+
+
+def pad(decks, fill):
+    """
+    Puts decks of different lengths into one array.
+    :param decks: The decks, as cards or card indices.
+    :param fill: The value behind the end of every deck, which has to differ from all card indices.
+    :return: An array with a row per deck and the length of every deck.
+    """
+    decks = [to_indices(deck) for deck in decks]
+    lengths = np.array([len(deck) for deck in decks], dtype=np.int64)
+
+    padded = np.full((len(decks), max(lengths.max(initial=0), 1)), fill, dtype=np.int64)
+    for i, deck in enumerate(decks):
+        padded[i, :len(deck)] = deck
+
+    return padded, lengths
+
+
+def lcs_lengths(decks, truths):
+    """
+    Gets the length of the longest common subsequence of every found deck and its true order.
+    All pairs are computed at once, one row of the dynamic programming table at a time.
+    :param decks: The found decks.
+    :param truths: The true order of every deck.
+    :return: The length of the longest common subsequence per deck.
+    """
+    found, found_lengths = pad(decks, -1)
+    truth, truth_lengths = pad(truths, -2)
+    batch = np.arange(len(found))
+
+    row = np.zeros((len(found), truth.shape[1] + 1), dtype=np.int64)
+    result = np.zeros(len(found), dtype=np.int64)
+
+    for i in range(found.shape[1] + 1):
+        if i > 0:
+            match = found[:, i - 1, None] == truth
+            # A row never decreases, so taking from the left is a running maximum.
+            candidates = np.maximum(row[:, 1:], np.where(match, row[:, :-1] + 1, 0))
+            row[:, 1:] = np.maximum.accumulate(candidates, axis=1)
+
+        done = found_lengths == i
+        result[done] = row[batch[done], truth_lengths[done]]
+
+    return result
+
+
+def edit_distances(decks, truths):
+    """
+    Gets the edit distance of every found deck to its true order, counting missing, extra and wrong cards.
+    All pairs are computed at once, one row of the dynamic programming table at a time.
+    :param decks: The found decks.
+    :param truths: The true order of every deck.
+    :return: The edit distance per deck.
+    """
+    found, found_lengths = pad(decks, -1)
+    truth, truth_lengths = pad(truths, -2)
+    batch = np.arange(len(found))
+    steps = np.arange(truth.shape[1] + 1)
+
+    row = np.tile(steps, (len(found), 1))
+    result = np.zeros(len(found), dtype=np.int64)
+
+    for i in range(found.shape[1] + 1):
+        if i > 0:
+            substitute = row[:, :-1] + (found[:, i - 1, None] != truth)
+            candidates = np.empty_like(row)
+            candidates[:, 0] = i
+            candidates[:, 1:] = np.minimum(row[:, 1:] + 1, substitute)
+            # Inserting from the left adds one per step, a running minimum after removing the steps.
+            row = np.minimum.accumulate(candidates - steps, axis=1) + steps
+
+        done = found_lengths == i
+        result[done] = row[batch[done], truth_lengths[done]]
+
+    return result
+
+
+def positional_scores(decks, truths):
+    """
+    Gets the fraction of cards that are found at their true position or one of its neighbours,
+    as line.accuracy_score does for the ordered deck.
+    :param decks: The found decks.
+    :param truths: The true order of every deck, all of the same length.
+    :return: The positional accuracy per deck, from 0 to 100.
+    """
+    truth = np.array([to_indices(order) for order in truths])
+    found, _ = pad(decks, -1)
+
+    # Pad the found decks so every true position has both neighbours.
+    width = max(found.shape[1], truth.shape[1]) + 2
+    window = np.full((len(found), width), -1, dtype=np.int64)
+    window[:, 1:found.shape[1] + 1] = found
+
+    positions = np.arange(truth.shape[1])
+    hits = np.zeros(truth.shape, dtype=bool)
+    for shift in range(3):
+        hits |= window[:, positions + shift] == truth
+
+    return hits.mean(axis=1) * 100
+
+
+def evaluate(decks, truths):
+    """
+    Scores found decks against their true orders.
+    :param decks: The found decks, as cards or card indices.
+    :param truths: The true order of every deck.
+    :return: A dict with arrays of the positional accuracy, the longest common subsequence accuracy,
+             the edit distance accuracy and the edit distance per deck, all accuracies from 0 to 100.
+    """
+    truth_lengths = np.array([len(order) for order in truths])
+    lcs = lcs_lengths(decks, truths)
+    distances = edit_distances(decks, truths)
+
+    return {
+        "positional": positional_scores(decks, truths),
+        "lcs": lcs / truth_lengths * 100,
+        "edit": np.maximum(1 - distances / truth_lengths, 0) * 100,
+        "distance": distances,
+    }
+
+
+def summarise(scores):
+    """
+    Averages the scores of evaluate over all decks.
+    :param scores: The scores returned by evaluate.
+    :return: A dict with the average of every score and the number of decks.
+    """
+    summary = {name: float(np.mean(values)) if len(values) else 0.0 for name, values in scores.items()}
+    summary["decks"] = len(scores["distance"])
+
+    return summary
+
+
+def main(archive=None):
+    """
+    Decodes a dataset and prints its average scores.
+    :param archive: Path of an archive written by synthetic.write_archive, defaults to Images_Ordered_Cropped,
+                    which is ordered by suit and then by rank.
+    :return: The average scores.
+    """
+    if archive is not None:
+        _, images, width = dataset.load_packed(archive)
+        truths = synthetic.load_orders(archive)
+        decks = [line.get_filtered_deck_packed(image, width) for image in images]
+    else:
+        _, images = dataset.load_frames("Images_Ordered_Cropped", color=False)
+        truths = [ordered] * len(images)
+        decks = [line.get_filtered_deck(image, True) for image in images]
+
+    summary = summarise(evaluate(decks, truths))
+    print("Decks: {decks}, positional: {positional:.2f}%, subsequence: {lcs:.2f}%, "
+          "edit: {edit:.2f}%, edit distance: {distance:.2f}".format(**summary))
+
+    return summary
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,10 @@
-import glob
 import os
 
 import cv2
 import numpy as np
-from sklearn.neighbors import LocalOutlierFactor
 
+import dataset
+import instrument
 import line
 
 """
@@ -20,7 +20,7 @@ min_distance = 2
 """
 Remove outliers parameters.
 :param n_neighbors: The actual number of neighbors use for outlier removal.
-:param contamination:  The proportion of outliers.
+:param contamination:  The proportion of outliers, or "auto" to reject points with a local outlier factor above 1.5.
 """
 n_neighbors = 30
 contamination = "auto"
@@ -37,6 +37,16 @@ Crop deck parameters.
 """
 white_threshold = 62
 
+"""
+Region of interest parameters.
+:param roi_padding: How much to grow a region of interest on each side, relative to its size.
+:param coarse_scale: The scale of the coarse pass that finds a region of interest.
+:param coarse_corners: Maximum number of corners to find in the coarse pass.
+"""
+roi_padding = .15
+coarse_scale = .125
+coarse_corners = 200
+
 
 def good_features(image, print_info=False):
     """
@@ -56,6 +66,38 @@ def good_features(image, print_info=False):
     return corners
 
 
+def local_outlier_factor(coordinates, k):
+    """
+    Computes the local outlier factor of every point, the same way as sklearn's LocalOutlierFactor.
+    :param coordinates: The points to compute the factors of.
+    :param k: The number of neighbors to compare each point to.
+    :return: The local outlier factor of every point, around 1 for inliers and larger for outliers.
+    """
+    points = np.asarray(coordinates, dtype=np.int32)
+    n = len(points)
+    k = max(1, min(k, n - 1))
+
+    # Squared distances between all pairs of points, a point is not its own neighbor.
+    x, y = points[:, 0], points[:, 1]
+    distances = np.subtract.outer(x, x)
+    distances *= distances
+    dy = np.subtract.outer(y, y)
+    dy *= dy
+    distances += dy
+    np.fill_diagonal(distances, np.iinfo(np.int32).max)
+
+    # The neighbors of every point are all points within its k-distance.
+    k_distances = np.partition(distances, k - 1, axis=1)[:, k - 1]
+    rows, cols = divmod(np.flatnonzero(distances <= k_distances[:, None]), n)
+
+    # Local reachability density, the inverse of the mean reachability distance to the neighbors.
+    reach_distances = np.sqrt(np.maximum(distances[rows, cols], k_distances[cols]))
+    counts = np.bincount(rows, minlength=n)
+    densities = counts / (np.bincount(rows, reach_distances, minlength=n) + 1e-10 * counts)
+
+    return np.bincount(rows, densities[cols], minlength=n) / counts / densities
+
+
 def remove_outliers(coordinates, print_info=False):
     """
     Removes outliers from the coordinates array.
@@ -63,10 +105,15 @@ def remove_outliers(coordinates, print_info=False):
     :param print_info: Whether to print information about this function.
     :return: The filtered coordinates array.
     """
-    clf = LocalOutlierFactor(n_neighbors=n_neighbors, contamination=contamination)
-    y_pred = clf.fit_predict(coordinates)
-    coordinates = [coordinates[i] for i in range(len(coordinates)) if y_pred[i] == 1]
-    filtered = np.array(coordinates)
+    factors = local_outlier_factor(coordinates, n_neighbors)
+
+    if contamination == "auto":
+        threshold = 1.5
+    else:
+        threshold = np.percentile(factors, 100 * (1 - contamination))
+
+    y_pred = np.where(factors > threshold, -1, 1)
+    filtered = np.asarray(coordinates)[y_pred == 1]
 
     if print_info:
         print("Y pred:\n", y_pred)
@@ -145,6 +192,7 @@ def corner_order(corners, print_info=False):
     return top_left, bottom_left, top_right, bottom_right
 
 
+@instrument.timed("finddeck.crop_deck")
 def crop_deck(image, corners, print_info=False):
     """
     Crops the image according to the corners found earlier.
@@ -173,17 +221,73 @@ def crop_deck(image, corners, print_info=False):
     return dst
 
 
-def compute_bounds(image):
+def pad_roi(roi, shape):
+    """
+    Grows a region of interest on all sides and clips it to the image.
+    :param roi: The region of interest as (x, y, width, height).
+    :param shape: The shape of the image.
+    :return: The padded region of interest as (x, y, width, height), with an even x and y.
+    """
+    x, y, w, h = roi
+    pad_x, pad_y = int(w * roi_padding), int(h * roi_padding)
+
+    # Keep the origin even, such that it maps exactly onto the half resolution image.
+    x0 = max(0, x - pad_x) // 2 * 2
+    y0 = max(0, y - pad_y) // 2 * 2
+    x1 = min(shape[1], x + w + pad_x)
+    y1 = min(shape[0], y + h + pad_y)
+
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def coarse_roi(image):
+    """
+    Finds a region of interest around the deck using a low resolution version of the image.
+    :param image: The image to find the deck in.
+    :return: The region of interest as (x, y, width, height).
+    """
+    small = cv2.resize(image, (0, 0), fx=coarse_scale, fy=coarse_scale, interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    corners = cv2.goodFeaturesToTrack(gray, maxCorners=coarse_corners, qualityLevel=quality_lvl, minDistance=1)
+    corners = remove_outliers(np.int32(corners[:, 0]))
+
+    x, y, w, h = cv2.boundingRect(corners)
+    return tuple(int(round(v / coarse_scale)) for v in (x, y, w + 1, h + 1))
+
+
+def roi_from_box(box):
+    """
+    Gets the region of interest around a box found earlier.
+    :param box: The box from compute_bounds.
+    :return: The region of interest as (x, y, width, height).
+    """
+    return cv2.boundingRect(np.int32(box))
+
+
+@instrument.timed("finddeck.compute_bounds")
+def compute_bounds(image, roi=None, coarse=False):
     """
     Computes the features of the specified image
     :param image: The image to compute the features of
+    :param roi: Optional region of interest as (x, y, width, height), corners are only searched in it after padding.
+    :param coarse: Whether to find a region of interest with a low resolution pass first if none is given.
     :return: The computed features of the corresponding image
     """
+    if roi is None and coarse:
+        roi = coarse_roi(image)
+
+    # Only search within the padded region of interest, if any.
+    x0, y0 = 0, 0
+    if roi is not None:
+        x0, y0, w, h = pad_roi(roi, image.shape)
+        image = image[y0:y0 + h, x0:x0 + w]
+
     # Find the markings on the cards and remove outliers.
     resize_factor = 0.5
     image = cv2.resize(image, (0, 0), fx=resize_factor, fy=resize_factor, interpolation=cv2.INTER_AREA)
     corners = good_features(image)
     corners = remove_outliers(corners)
+    corners = corners + np.int32([x0, y0]) // int(1 / resize_factor)
 
     # Find bounding boxes on the left and right parts of the card deck.
     box_begin = min(corners[:, 0])
@@ -245,14 +349,14 @@ def print_image(image, corners=None, box_left=None, box_right=None, box=None):
 
 
 def main(export_dots=False):
-    files = glob.glob("Images_Ordered/*.png")
+    names, frames = dataset.load_frames("Images_Ordered")
     acc_scores = []
 
-    for filename in files:
-        image = cv2.imread(filename)
-        print(filename)
+    for name, frame in zip(names, frames):
+        # The stored frames are read only, the features are drawn on a copy.
+        image = np.array(frame)
+        print(name)
 
-        name = filename.lstrip("Images_Ordered/")
         corners, box_left, box_right, box = compute_bounds(image)
 
         if export_dots and corners is not None:
@@ -0,0 +1,167 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+
+"""
+Instrumentation parameters.
+:param enabled: Whether timers and counters record anything, set DECK_INSTRUMENT=1 to enable at startup.
+:param buckets: Upper bounds of the timing histogram buckets in seconds, the last bucket catches everything above.
+"""
+enabled = os.environ.get("DECK_INSTRUMENT", "0") == "1"
+buckets = [.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5]
+
+counters = {}
+timings = {}
+lock = threading.Lock()
+
+
+def enable(on=True):
+    """
+    Turns the instrumentation on or off.
+    :param on: Whether to record timers and counters.
+    """
+    global enabled
+    enabled = on
+
+
+def reset():
+    """
+    Forgets all recorded counters and timings.
+    """
+    with lock:
+        counters.clear()
+        timings.clear()
+
+
+def count(name, amount=1):
+    """
+    Increases a cumulative counter.
+    :param name: The name of the counter.
+    :param amount: How much to increase the counter by.
+    """
+    if not enabled:
+        return
+
+    with lock:
+        counters[name] = counters.get(name, 0) + amount
+
+
+def record(name, seconds):
+    """
+    Adds a duration to the timing histogram of a name.
+    :param name: The name of the timed section.
+    :param seconds: How long the section took.
+    """
+    with lock:
+        timing = timings.get(name)
+        if timing is None:
+            timing = timings[name] = {"count": 0, "total": 0.0, "max": 0.0, "buckets": (len(buckets) + 1) * [0]}
+
+        timing["count"] += 1
+        timing["total"] += seconds
+        timing["max"] = max(timing["max"], seconds)
+        timing["buckets"][bisect_left(buckets, seconds)] += 1
+
+
+class Timer:
+    def __init__(self, name):
+        """
+        Initialises a timer that can be used as a context manager around a section.
+        :param name: The name of the timed section.
+        """
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        """
+        Starts timing the section if instrumentation is enabled.
+        :return: This timer.
+        """
+        if enabled:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        """
+        Records the duration of the section, also when it raised an error.
+        """
+        if self.start is not None:
+            record(self.name, time.perf_counter() - self.start)
+            self.start = None
+
+
+def timed(name):
+    """
+    Creates a decorator that records the duration of every call of a function.
+    When instrumentation is disabled the only cost is a single check per call.
+    :param name: The name of the timed function.
+    :return: The decorator.
+    """
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+def snapshot():
+    """
+    Gets a copy of all recorded counters and timings.
+    :return: A dict containing the counters and the timing histograms, with their bucket bounds.
+    """
+    with lock:
+        return {
+            "enabled": enabled,
+            "counters": dict(counters),
+            "buckets": buckets,
+            "timings": {name: dict(timing, buckets=list(timing["buckets"])) for name, timing in timings.items()},
+        }
+
+
+def merge(recorded):
+    """
+    Adds counters and timings recorded elsewhere, as by another process, to the ones recorded here.
+    :param recorded: A snapshot of the other counters and timings.
+    """
+    with lock:
+        for name, amount in recorded["counters"].items():
+            counters[name] = counters.get(name, 0) + amount
+
+        for name, other in recorded["timings"].items():
+            timing = timings.get(name)
+            if timing is None:
+                timing = timings[name] = {"count": 0, "total": 0.0, "max": 0.0, "buckets": (len(buckets) + 1) * [0]}
+
+            timing["count"] += other["count"]
+            timing["total"] += other["total"]
+            timing["max"] = max(timing["max"], other["max"])
+            timing["buckets"] = [a + b for a, b in zip(timing["buckets"], other["buckets"])]
+
+
+def collect(function, *args):
+    """
+    Runs a function in a worker process and returns what it recorded, to be merged in the parent process.
+    The worker forgets its earlier recordings, so every call only returns its own.
+    :param function: The function to run.
+    :param args: The arguments of the function.
+    :return: The result of the function or None, a snapshot of its recordings and the error it raised or None.
+    """
+    reset()
+    try:
+        result, error = function(*args), None
+    except Exception as e:
+        result, error = None, e
+
+    return result, snapshot(), error
@@ -1,25 +1,174 @@
+import json
 import socket
 import struct
+import time
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIServer
 
 from bottle import *
 
 import card
+import deckstate
+import instrument
+from deckstate import DeckState
+
+"""
+Change notification parameters.
+:param poll_interval: How often to check the shared deck state for a new version, in seconds.
+:param max_timeout: The maximum time a long poll may wait for a change, in seconds.
+:param keep_alive: How often to send a comment on an idle event stream, in seconds.
+"""
+poll_interval = .05
+max_timeout = 60
+keep_alive = 15
+
+"""
+The shared deck and statistics states published by livefeed, opened when they are first served.
+"""
+state = None
+stats_state = None
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    """
+    A WSGI server handling every request in its own thread, such that waiting clients do not block others.
+    """
+    daemon_threads = True
+
+
+def read_deck():
+    """
+    Reads the latest published deck.
+    :return: The version of the deck and the deck as a string.
+    """
+    global state
+
+    if state is None:
+        state = DeckState()
+    return state.read()
+
+
+def deck_json(version, data):
+    """
+    Turns a deck string into the data presented on the web pages.
+    :param version: The version of the deck.
+    :param data: The deck as a string.
+    :return: The data to be presented on the web page.
+    """
+    return {
+        "version": version,
+        "data": data,
+        "cards": [str(card.number_to_card(int(str(data[i]) + str(data[i + 1]))))
+                  for i in range(0, len(data) - 1, 2)]
+    }
+
+
+def wait_for_change(since, timeout):
+    """
+    Waits until a deck newer than a version is published.
+    :param since: The last version the client has seen.
+    :param timeout: The maximum time to wait, in seconds.
+    :return: The version of the latest deck and the deck as a string, which is unchanged if the wait timed out.
+    """
+    deadline = time.time() + timeout
+    version, data = read_deck()
+
+    while version <= since and time.time() < deadline:
+        time.sleep(poll_interval)
+        version, data = read_deck()
+
+    return version, data
 
 
 @get("/")
+@instrument.timed("jsonhost.serve_json")
 def serve_json():
     """
     Hosts a Json web page.
+    Responds with 304 Not Modified if the client already has the current version.
+    :return: The data to be presented on the web page.
+    """
+    version, data = read_deck()
+    etag = '"{}"'.format(version)
+
+    if request.headers.get("If-None-Match") == etag:
+        return HTTPResponse(status=304, ETag=etag)
+
+    response.set_header("ETag", etag)
+    return deck_json(version, data)
+
+
+@get("/changes")
+@instrument.timed("jsonhost.serve_changes")
+def serve_changes():
+    """
+    Hosts a long poll web page, which responds as soon as a deck newer than the since parameter is published.
+    Responds with the current deck once the timeout parameter, in seconds, expires.
     :return: The data to be presented on the web page.
     """
-    with open("jsondata.txt", "r") as f:
-        data = f.read()
+    try:
+        since = int(request.query.get("since", -1))
+        timeout = min(float(request.query.get("timeout", 30)), max_timeout)
+    except ValueError:
+        return HTTPResponse(status=400, body="The since and timeout parameters have to be numbers.")
+
+    version, data = wait_for_change(since, timeout)
+    response.set_header("ETag", '"{}"'.format(version))
+    return deck_json(version, data)
+
+
+@get("/events")
+def serve_events():
+    """
+    Hosts a server-sent event stream, which sends every newly published deck.
+    :return: A generator of events.
+    """
+    last_id = request.headers.get("Last-Event-ID")
+    try:
+        since = int(request.query.get("since", last_id if last_id is not None else -1))
+    except ValueError:
+        return HTTPResponse(status=400, body="The since parameter and Last-Event-ID header have to be numbers.")
+
+    response.content_type = "text/event-stream"
+    response.set_header("Cache-Control", "no-cache")
+
+    def events():
+        version = since
+        while True:
+            new_version, data = wait_for_change(version, keep_alive)
 
-        return {
-            "data": data,
-            "cards": [str(card.number_to_card(int(str(data[i]) + str(data[i + 1]))))
-                      for i in range(0, len(data) - 1, 2)]
-        }
+            if new_version <= version:
+                # Keep the connection alive.
+                yield ": keep-alive\n\n"
+                continue
+
+            version = new_version
+            yield "id: {}\ndata: {}\n\n".format(version, json.dumps(deck_json(version, data)))
+
+    return events()
+
+
+def read_stats():
+    """
+    Reads the latest instrumentation shared by livefeed.
+    :return: The counters and timing histograms of livefeed, or None if it did not share any yet.
+    """
+    global stats_state
+
+    if stats_state is None:
+        stats_state = DeckState(deckstate.stats_path, deckstate.stats_size)
+    _, data = stats_state.read()
+
+    return json.loads(data) if data else None
+
+
+@get("/stats")
+def serve_stats():
+    """
+    Hosts the instrumentation counters and timings of livefeed and of this server.
+    :return: The recorded counters and timing histograms per process.
+    """
+    return {"livefeed": read_stats(), "jsonhost": instrument.snapshot()}
 
 
 def get_ip_address(if_name):
@@ -46,7 +195,7 @@ def main():
     """
     try:
         print(get_ip_address("eth0"))
-        run(host="0.0.0.0", port=8080)
+        run(host="0.0.0.0", port=8080, server_class=ThreadingWSGIServer)
     finally:
         sock.close()
 
@@ -1,9 +1,11 @@
-import os
 from itertools import groupby
 
 import cv2
+import numpy as np
 
-from card import get_card_old, Card
+import dataset
+import instrument
+from card import card_table_old, symbol_table_old, pack_code, Card
 
 """
 Get codes parameters.
@@ -11,6 +13,20 @@ Get codes parameters.
 """
 width_params = [1.17, 1.9, 2.94]
 
+"""
+Sampled decoding parameters.
+:param sample_stride: Decode every so many lines first, a card spans about six lines.
+"""
+sample_stride = 2
+
+"""
+Error correction parameters.
+:param max_cost: The largest soft distance to the nearest code a line may have, in unit widths.
+:param min_confidence: The lowest accepted confidence, 1 - nearest distance / second nearest distance.
+"""
+max_cost = 1
+min_confidence = .75
+
 
 def get_runs(line):
     """
@@ -128,6 +144,7 @@ def print_info(runs, start, width, whites, blacks, codes, index, line, image):
     cv2.line(image, (0, index), (len(line), index), (255, 0, 0), 1)
 
 
+@instrument.timed("line.get_deck")
 def get_deck(image, show_image=False):
     """
     Turns an image into a deck.
@@ -164,31 +181,410 @@ def get_deck(image, show_image=False):
     return deck
 
 
+def get_runs_batch(image):
+    """
+    Gets the runs of every line of an image at once.
+    Produces the same runs as get_runs for each line, padded with zeros into one array.
+    :param image: The deck image.
+    :return: An array of runs per line, the number of runs per line and whether each line could be split into runs.
+    """
+    image = np.asarray(image)
+    height, width = image.shape[:2]
+
+    # Find the boundaries of the runs of equal pixels on every line.
+    change = np.ones((height, width + 1), dtype=bool)
+    change[:, 1:-1] = image[:, 1:] != image[:, :-1]
+    rows, cols = np.nonzero(change)
+
+    return split_runs(rows, cols, image[rows, np.minimum(cols, width - 1)], height)
+
+
+def get_runs_packed(packed, width):
+    """
+    Gets the runs of every line of a bit packed deck image at once, finding the run boundaries on the packed bytes.
+    Produces the same runs as get_runs_batch on the unpacked image.
+    :param packed: The deck image packed with np.packbits along its rows, a set bit is white.
+    :param width: The width of the unpacked image.
+    :return: An array of runs per line, the number of runs per line and whether each line could be split into runs.
+    """
+    packed = np.asarray(packed, dtype=np.uint8)
+    height = packed.shape[0]
+
+    # Every bit is compared to the bit in front of it, which for the first bit of a byte is the last bit of the byte before.
+    carry = np.zeros_like(packed)
+    carry[:, 1:] = packed[:, :-1] << 7
+    transitions = packed ^ ((packed >> 1) | carry)
+
+    change = np.ones((height, width + 1), dtype=bool)
+    change[:, 1:-1] = np.unpackbits(transitions, axis=1)[:, 1:width].astype(bool)
+    rows, cols = np.nonzero(change)
+
+    cols_in_image = np.minimum(cols, width - 1)
+    bits = (packed[rows, cols_in_image >> 3] >> (7 - (cols_in_image & 7))) & 1
+
+    return split_runs(rows, cols, bits * np.uint8(255), height)
+
+
+def split_runs(rows, cols, values, height):
+    """
+    Turns the run boundaries of every line into runs, filtered the same way as get_runs.
+    :param rows: The line of every boundary, sorted.
+    :param cols: The position of every boundary within its line, including one behind the end of the line.
+    :param values: The pixel value starting at every boundary.
+    :param height: The number of lines.
+    :return: An array of runs per line, the number of runs per line and whether each line could be split into runs.
+    """
+    # Consecutive boundaries on the same line enclose a run.
+    same_row = rows[1:] == rows[:-1]
+    run_rows = rows[:-1][same_row]
+    run_lengths = (cols[1:] - cols[:-1])[same_row]
+    run_values = values[:-1][same_row]
+
+    # Remove runs of a single pixel.
+    keep = run_lengths > 1
+    run_rows, run_lengths, run_values = run_rows[keep], run_lengths[keep], run_values[keep]
+
+    # Remove the first run of a line if it is white.
+    first = np.ones(len(run_rows), dtype=bool)
+    first[1:] = run_rows[1:] != run_rows[:-1]
+    keep = ~(first & (run_values == 255))
+    run_rows, run_lengths, run_values = run_rows[keep], run_lengths[keep], run_values[keep]
+
+    # Lines with two adjacent runs of the same colour are rejected, as get_runs fails on them.
+    valid = np.ones(height, dtype=bool)
+    merged = (run_rows[1:] == run_rows[:-1]) & (run_values[1:] == run_values[:-1])
+    valid[run_rows[1:][merged]] = False
+
+    # Scatter the runs into a zero padded array with one line per image row.
+    counts = np.bincount(run_rows, minlength=height)
+    offsets = np.cumsum(counts) - counts
+    positions = np.arange(len(run_rows)) - offsets[run_rows]
+    runs = np.zeros((height, max(counts.max(initial=0), 1)), dtype=np.int64)
+    runs[run_rows, positions] = run_lengths
+
+    return runs, counts, valid & (counts > 0)
+
+
+def get_start_batch(runs, counts, variance):
+    """
+    Gets the start of the code in the runs array of every line.
+    :param runs: Array of runs per line.
+    :param counts: The number of runs per line.
+    :param variance: Variance for error correction.
+    :return: The start index of the card code per line, or -1 if no start was found.
+    """
+    candidates = runs[:, :-2]
+    matches = ((np.abs(runs[:, 1:-1] - candidates) <= variance) &
+               (np.abs(runs[:, 2:] - candidates) <= variance) &
+               (np.arange(candidates.shape[1]) < (counts - 2)[:, None]))
+
+    found = matches.any(axis=1)
+    return np.where(found, matches.argmax(axis=1), -1)
+
+
+def get_codes_batch(whites, blacks, width):
+    """
+    Gets the codes from the whites and blacks of every line.
+    :param whites: Array containing the white parts of the code per line, starting in front of the first black.
+    :param blacks: Array containing the black parts of the code per line.
+    :param width: Width of code segments per line.
+    :return: The corresponding codes per line.
+    """
+    width = width[:, None]
+    short = blacks < width * width_params[0]
+    right, _ = get_right_batch(whites, short, width)
+
+    codes = np.where(short, np.where(right, "01", "10"), "11")
+    return codes.tolist()
+
+
+def get_right_batch(whites, short, width):
+    """
+    Decides for every short black whether it is the right part of a 01 code, as get_codes does.
+    :param whites: Array containing the white parts of the code per line.
+    :param short: Whether each black part is short.
+    :param width: Width of code segments per line, as a column.
+    :return: Whether each part is a 01 code if its black is short,
+             and whether the part before it is a 10 code, which raises the white width needed for a 01 code.
+    """
+    wide = whites > width_params[1] * width
+    wider = whites > width_params[2] * width
+
+    right = np.zeros(whites.shape, dtype=bool)
+    left_before = np.zeros(whites.shape, dtype=bool)
+    right[:, 0] = wide[:, 0]
+    for i in range(1, whites.shape[1]):
+        left_before[:, i] = short[:, i - 1] & ~right[:, i - 1]
+        right[:, i] = (~left_before[:, i] & wide[:, i]) | wider[:, i]
+
+    return right, left_before
+
+
+def get_symbol_costs(whites, blacks, width):
+    """
+    Gets how far the parts of the code of every line are from being read as each symbol.
+    The symbol get_codes reads costs nothing, the others cost how many unit widths a black or white part
+    would have to grow or shrink to cross the thresholds of get_codes.
+    :param whites: Array containing the white parts of the code per line, starting in front of the first black.
+    :param blacks: Array containing the black parts of the code per line.
+    :param width: Width of code segments per line.
+    :return: Array of costs per line, part and symbol, with the symbols ordered as card.symbols.
+    """
+    width = width[:, None].astype(np.float64)
+    short = blacks < width * width_params[0]
+    _, left_before = get_right_batch(whites, short, width)
+
+    black_margin = (blacks - width * width_params[0]) / width
+    white_margin = (whites - np.where(left_before, width_params[2], width_params[1]) * width) / width
+    short_cost = np.maximum(black_margin, 0)
+
+    costs = np.empty(whites.shape + (3,))
+    costs[..., 0] = short_cost + np.maximum(-white_margin, 0)
+    costs[..., 1] = short_cost + np.maximum(white_margin, 0)
+    costs[..., 2] = np.maximum(-black_margin, 0)
+
+    return costs
+
+
+def correct_codes_batch(whites, blacks, width):
+    """
+    Finds the card with the nearest code for every line, by the soft distance of get_symbol_costs.
+    :param whites: Array containing the white parts of the code per line, starting in front of the first black.
+    :param blacks: Array containing the black parts of the code per line.
+    :param width: Width of code segments per line.
+    :return: The index of the nearest card, its distance and the confidence per line.
+    """
+    costs = get_symbol_costs(whites, blacks, width)
+    distances = costs[:, np.arange(4), symbol_table_old].sum(axis=-1)
+
+    order = np.argsort(distances, axis=1)[:, :2]
+    nearest = np.take_along_axis(distances, order[:, :1], axis=1)[:, 0]
+    second = np.take_along_axis(distances, order[:, 1:], axis=1)[:, 0]
+    confidence = np.where(second > 0, 1 - nearest / np.maximum(second, 1e-9), 0)
+
+    return order[:, 0], nearest, confidence
+
+
+@instrument.timed("line.get_deck_vectorized")
+def get_deck_vectorized(image):
+    """
+    Turns an image into a deck, decoding all lines at once.
+    Gives the same result as get_deck.
+    :param image: The image.
+    :return: A deck.
+    """
+    return get_deck_runs(*get_runs_batch(image))
+
+
+@instrument.timed("line.get_deck_packed")
+def get_deck_packed(packed, width=300):
+    """
+    Turns a bit packed image into a deck, decoding all lines at once without unpacking the image.
+    Gives the same result as get_deck on the unpacked image.
+    :param packed: The image packed with np.packbits along its rows, a set bit is white.
+    :param width: The width of the unpacked image.
+    :return: A deck.
+    """
+    return get_deck_runs(*get_runs_packed(packed, width))
+
+
+def get_deck_runs(runs, counts, valid):
+    """
+    Turns the runs of all lines into a deck.
+    :param runs: Array of runs per line.
+    :param counts: The number of runs per line.
+    :param valid: Whether each line could be split into runs.
+    :return: A deck.
+    """
+    return decode_runs(runs, counts, valid)[0]
+
+
+def decode_runs(runs, counts, valid):
+    """
+    Turns the runs of all lines into codes, skipping the lines that cannot be decoded.
+    :param runs: Array of runs per line.
+    :param counts: The number of runs per line.
+    :param valid: Whether each line could be split into runs.
+    :return: The codes of the decoded lines and the indices of these lines.
+    """
+    whites, blacks, width, decoded = get_segments_batch(runs, counts, valid)
+    if len(decoded) == 0:
+        return [], decoded
+
+    return get_codes_batch(whites, blacks, width), decoded
+
+
+def get_segments_batch(runs, counts, valid):
+    """
+    Finds the white and black parts of the code of every line.
+    :param runs: Array of runs per line.
+    :param counts: The number of runs per line.
+    :param valid: Whether each line could be split into runs.
+    :return: The white parts, black parts and unit width of the decodable lines, and the indices of these lines.
+    """
+    empty = np.zeros((0, 4), dtype=runs.dtype)
+    if runs.shape[1] < 3:
+        return empty, empty, np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    start = get_start_batch(runs, counts, 6)
+
+    # The start triplet and the four codes behind it have to fit in the runs.
+    valid &= (start >= 0) & (start + 10 < counts)
+    decoded = np.flatnonzero(valid)
+    runs, start = runs[decoded], start[decoded]
+    if len(runs) == 0:
+        return empty, empty, np.zeros(0, dtype=np.int64), decoded
+
+    lines = np.arange(len(runs))[:, None]
+    triplet = runs[lines, start[:, None] + np.arange(3)]
+    width = np.round(triplet.sum(axis=1) / 3).astype(np.int64)
+
+    whites = runs[lines, start[:, None] + np.arange(3, 11, 2)]
+    blacks = runs[lines, start[:, None] + np.arange(4, 12, 2)]
+
+    return whites, blacks, width, decoded
+
+
+def decode_lines(image, lines, found):
+    """
+    Decodes some lines of an image into cards.
+    :param image: The image.
+    :param lines: The indices of the lines to decode.
+    :param found: Array of card indices per line, -1 where no card was found, filled in for the decoded lines.
+    """
+    codes, decoded = decode_runs(*get_runs_batch(image[lines]))
+    found[lines] = -1
+
+    rejected = 0
+    for code, line in zip(codes, lines[decoded]):
+        card = lookup_card(code)
+        if card is not None:
+            found[line] = card.index
+        else:
+            rejected += 1
+
+    instrument.count("rows.decoded", len(codes))
+    instrument.count("rows.rejected", rejected)
+
+
 def lookup_card(code):
     """
     Gets a card from a code.
     :param code: The code of the card.
-    :return: The card corresponding to the code.
+    :return: The card corresponding to the code, or None if no card has this code.
     """
-    try:
-        card = get_card_old(code)
-        return card
-    except LookupError:
-        return None
+    return card_table_old[pack_code(code)]
 
 
-def get_filtered_deck(image):
+@instrument.timed("line.get_filtered_deck")
+def get_filtered_deck(image, vectorized=False):
     """
     Gets an image and turns it into a filtered array of cards.
     :param image: The image to get the deck from.
+    :param vectorized: Whether to decode all lines at once using get_deck_vectorized.
+    :return: A filtered array of cards.
+    """
+    codes = get_deck_vectorized(image) if vectorized else get_deck(image)
+    return filter_deck(codes)
+
+
+@instrument.timed("line.get_filtered_deck_packed")
+def get_filtered_deck_packed(packed, width=300):
+    """
+    Gets a bit packed image and turns it into a filtered array of cards.
+    :param packed: The image packed with np.packbits along its rows, a set bit is white.
+    :param width: The width of the unpacked image.
     :return: A filtered array of cards.
     """
-    deck = [lookup_card(card) for card in get_deck(image)]
+    return filter_deck(get_deck_packed(packed, width))
+
+
+def filter_deck(codes):
+    """
+    Turns the codes of all lines into a filtered array of cards, keeping cards found on at least two consecutive lines.
+    :param codes: The codes per line.
+    :return: A filtered array of cards.
+    """
+    deck = [lookup_card(card) for card in codes]
     deck = [card for card in deck if card is not None]
-    groups = groupby(deck, lambda x: (x.rank, x.suit))
-    deck = [Card(x[0], x[1]) for x, y in groups if len(list(y)) >= 2]
 
-    return deck
+    instrument.count("rows.decoded", len(codes))
+    instrument.count("rows.rejected", len(codes) - len(deck))
+
+    return keep_repeated(deck)
+
+
+@instrument.timed("line.get_filtered_deck_corrected")
+def get_filtered_deck_corrected(image):
+    """
+    Gets an image and turns it into a filtered array of cards, correcting lines whose code has no card
+    to the card with the nearest code when it is close and clearly nearer than any other.
+    :param image: The image to get the deck from.
+    :return: A filtered array of cards.
+    """
+    whites, blacks, width, decoded = get_segments_batch(*get_runs_batch(image))
+    if len(decoded) == 0:
+        return []
+
+    nearest, distance, confidence = correct_codes_batch(whites, blacks, width)
+    accepted = (distance <= max_cost) & (confidence >= min_confidence)
+
+    instrument.count("rows.decoded", len(decoded))
+    instrument.count("rows.corrected", int(np.count_nonzero(accepted & (distance > 0))))
+    instrument.count("rows.rejected", len(decoded) - int(np.count_nonzero(accepted)))
+
+    return keep_repeated([Card.from_index(int(index)) for index in nearest[accepted]])
+
+
+def keep_repeated(deck):
+    """
+    Keeps the cards found on at least two consecutive lines, once.
+    :param deck: The cards per line.
+    :return: A filtered array of cards.
+    """
+    groups = groupby(deck)
+    return [x for x, y in groups if len(list(y)) >= 2]
+
+
+@instrument.timed("line.get_filtered_deck_sampled")
+def get_filtered_deck_sampled(image, stride=sample_stride):
+    """
+    Gets an image and turns it into a filtered array of cards, decoding only some of its lines.
+    Every stride-th line is decoded first. If that already gives all 52 cards the other lines are skipped,
+    otherwise the neighbours of cards found on only one of these lines are decoded to confirm them.
+    :param image: The image to get the deck from.
+    :param stride: Decode every so many lines first, 1 decodes all lines.
+    :return: A filtered array of cards and the number of lines that were decoded.
+    """
+    height = len(image)
+    found = np.full(height, -1, dtype=np.int64)
+    decoded = np.zeros(height, dtype=bool)
+
+    sampled = np.arange(0, height, stride)
+    decode_lines(image, sampled, found)
+    decoded[sampled] = True
+
+    if stride > 1 and len(set(keep_repeated(found[sampled][found[sampled] >= 0].tolist()))) < 52:
+        # Cards that differ from the sampled lines around them are not confirmed yet.
+        cards = found[sampled]
+        before = np.r_[-1, cards[:-1]]
+        after = np.r_[cards[1:], -1]
+        single = sampled[(cards >= 0) & (cards != before) & (cards != after)]
+
+        neighbours = np.union1d(single - 1, single + 1)
+        neighbours = neighbours[(neighbours >= 0) & (neighbours < height)]
+        neighbours = neighbours[~decoded[neighbours]]
+        if len(neighbours) > 0:
+            decode_lines(image, neighbours, found)
+            decoded[neighbours] = True
+
+    rows = int(np.count_nonzero(decoded))
+    instrument.count("rows.sampled", rows)
+
+    cards = found[decoded]
+    deck = [Card.from_index(int(index)) for index in keep_repeated(cards[cards >= 0].tolist())]
+
+    return deck, rows
 
 
 def accuracy_score(deck):
@@ -215,39 +611,54 @@ def check_range(deck, index, rank, suit):
     :param suit: The suit of the card to check.
     :return: True if the middle card or one of its neighbours is equal to Card(rank, suit).
     """
+    card = Card.from_index(suit * 13 + rank)
     for i in range(max(0, index - 1), min(index + 2, len(deck))):
-        if deck[i] == Card(rank, suit):
+        if deck[i] == card:
             return 1
 
     return 0
 
 
-def main():
+def main(vectorized=False, archive=None, stride=None, corrected=False):
     """
     Prints the cards of a deck and the corresponding accuracy.
+    :param vectorized: Whether to decode all lines at once using get_deck_vectorized.
+    :param archive: Path of a bit packed archive of the images written by dataset.pack_directory, to use instead.
+    :param stride: Decode only some lines using get_filtered_deck_sampled with this stride,
+                   and print the average number of lines decoded and the average accuracy.
+    :param corrected: Whether to correct misread lines using get_filtered_deck_corrected.
     """
-    images = []
-    count = 0
-    limit = 120
-
-    for path in os.listdir("Images_Ordered_Cropped"):
-        if count > limit:
-            break
-
-        count += 1
-        images.append(cv2.imread("Images_Ordered_Cropped/" + path, 0))
+    if archive is not None:
+        _, images, width = dataset.load_packed(archive)
+    else:
+        _, images = dataset.load_frames("Images_Ordered_Cropped", color=False)
 
     ms = 0
     best_codes = []
+    total_rows = 0
+    total_score = 0
     for image in images:
-        deck = get_filtered_deck(image)
+        if archive is not None:
+            deck = get_filtered_deck_packed(image, width)
+            rows = len(image)
+        elif stride is not None:
+            deck, rows = get_filtered_deck_sampled(image, stride)
+        elif corrected:
+            deck = get_filtered_deck_corrected(image)
+            rows = len(image)
+        else:
+            deck = get_filtered_deck(image, vectorized)
+            rows = len(image)
         score = accuracy_score(deck)
+        total_rows += rows
+        total_score += score
 
         if score > ms:
             ms = score
             best_codes = [i for i in deck]
 
     print(ms, [str(card) for card in best_codes])
+    print("Lines decoded: {:.1f}, average accuracy: {:.2f}%".format(total_rows / len(images), total_score / len(images)))
 
 
 if __name__ == "__main__":
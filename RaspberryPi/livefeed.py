@@ -1,4 +1,6 @@
+import json
 import os
+import threading
 import time
 
 import cv2
@@ -6,8 +8,28 @@ from picamera import PiCamera
 from picamera.array import PiRGBArray
 
 import finddeck
+import instrument
 import line
+import deckstate
+import pipeline
 from card import deck_to_string
+from consensus import Consensus
+from deckstate import DeckState
+from tracker import Tracker
+
+
+"""
+Statistics parameters.
+:param stats_interval: How often the instrumentation is shared with jsonhost, in seconds.
+"""
+stats_interval = 1
+
+"""
+The shared deck and statistics states, opened when they are first published.
+"""
+state = None
+stats_state = None
+stats_published = 0
 
 
 def initialise():
@@ -56,34 +78,103 @@ def make_images():
             break
 
 
-def main(print_info=False, show_image=False):
+def capture_frames(camera, raw_capture):
+    """
+    Yields frames from the camera until the generator is closed.
+    :param camera: The camera.
+    :param raw_capture: The raw camera capture.
+    :return: A generator of frames.
+    """
+    for frame in camera.capture_continuous(raw_capture, format="bgr", use_video_port=True):
+        image = frame.array.copy()
+        raw_capture.truncate(0)
+        yield image
+
+
+def publish_deck(deck):
+    """
+    Publishes a deck as a string to the shared deck state read by jsonhost.
+    :param deck: The deck.
+    """
+    global state
+
+    if state is None:
+        state = DeckState()
+    state.publish(deck_to_string(deck))
+
+
+def publish_stats():
+    """
+    Shares the instrumentation of this process with jsonhost, which serves it on /stats.
+    Does nothing when instrumentation is disabled or the statistics were shared less than stats_interval ago.
+    """
+    global stats_state, stats_published
+
+    now = time.time()
+    if not instrument.enabled or now - stats_published < stats_interval:
+        return
+
+    if stats_state is None:
+        stats_state = DeckState(deckstate.stats_path, deckstate.stats_size)
+    stats_state.publish(json.dumps(instrument.snapshot(), separators=(",", ":")))
+    stats_published = now
+
+
+def print_deck(deck, votes=None):
+    """
+    Prints a deck and its accuracy.
+    :param deck: The deck.
+    :param votes: The consensus the deck comes from, if any, to print the confidence of every card.
+    """
+    if votes is None:
+        print(", ".join([str(c) for c in deck]))
+    else:
+        print(", ".join(["{} ({:.0%})".format(c, p) for c, p in zip(deck, votes.confidence)]))
+    print("Accuracy: {:.2f}%".format(line.accuracy_score(deck)))
+
+
+def main(print_info=False, show_image=False, track=False, smooth=False):
     """
     Gets frames from the camera and turns them into decks.
-    These decks are saved to a file as a string.
+    These decks are published to the shared deck state as a string.
     :param print_info: Whether to print the deck info.
     :param show_image: Whether to print the frame and cropped image.
+    :param track: Whether to reuse the bounds of the previous frame while the deck does not move.
+    :param smooth: Whether to publish the consensus of the last frames instead, only when it changes.
     """
     camera, raw_capture = initialise()
+    tracker = Tracker()
+    votes = Consensus() if smooth else None
 
     # Capture frames from the camera.
     for frame in camera.capture_continuous(raw_capture, format='bgr', use_video_port=True):
         image = frame.array.copy()
         raw_capture.truncate(0)
+        publish_stats()
 
         try:
-            corners, _, _, box = finddeck.compute_bounds(image)
-        except IndexError:
+            if track:
+                corners, _, _, box = tracker.update(image)
+            else:
+                corners, _, _, box = finddeck.compute_bounds(image)
+
+            cropped = finddeck.crop_deck(image, box)
+            deck = line.get_filtered_deck(cropped)
+        except (IndexError, TypeError, ValueError, cv2.error):
+            instrument.count("frames.dropped")
             continue
 
-        cropped = finddeck.crop_deck(image, box)
-        deck = line.get_filtered_deck(cropped)
+        instrument.count("frames.processed")
 
-        with open("jsondata.txt", "w+") as f:
-            f.write(deck_to_string(deck))
+        if votes is None:
+            publish_deck(deck)
+        elif votes.update(deck):
+            publish_deck(votes.deck)
+        else:
+            instrument.count("frames.unchanged")
 
         if print_info:
-            print(", ".join([str(c) for c in deck]))
-            print("Accuracy: {:.2f}%".format(line.accuracy_score(deck)))
+            print_deck(votes.deck if votes else deck, votes)
 
         if show_image:
             cv2.imshow("Cropped", cropped)
@@ -94,6 +185,70 @@ def main(print_info=False, show_image=False):
             break
 
 
+def main_pipelined(print_info=False, track=False, worker_count=pipeline.workers, queue_depth=pipeline.depth,
+                   smooth=False):
+    """
+    Gets frames from the camera and turns them into decks, capturing, decoding and publishing concurrently.
+    When decoding falls behind, the oldest waiting frames are dropped in favour of the newest.
+    These decks are published to the shared deck state as a string. Stop with ctrl+c.
+    :param print_info: Whether to print the deck info.
+    :param track: Whether to reuse the bounds of the previous frame while the deck does not move.
+    :param worker_count: The number of frames that are decoded at the same time.
+    :param queue_depth: The number of frames that may wait for decoding.
+    :param smooth: Whether to publish the consensus of the last frames instead, only when it changes.
+    :return: The pipeline statistics.
+    """
+    # Decks are published by one thread, which keeps the consensus.
+    votes = Consensus() if smooth else None
+
+    # Every worker thread keeps its own tracker, trackers are not thread safe.
+    trackers = threading.local()
+
+    def process(image):
+        if track:
+            if not hasattr(trackers, "tracker"):
+                trackers.tracker = Tracker()
+            _, _, _, box = trackers.tracker.update(image)
+        else:
+            _, _, _, box = finddeck.compute_bounds(image)
+
+        return line.get_filtered_deck(finddeck.crop_deck(image, box))
+
+    def publish(deck):
+        instrument.count("frames.processed")
+        publish_stats()
+
+        if votes is None:
+            publish_deck(deck)
+        elif votes.update(deck):
+            publish_deck(votes.deck)
+        else:
+            instrument.count("frames.unchanged")
+
+        if print_info:
+            print_deck(votes.deck if votes else deck, votes)
+
+    def vote(deck):
+        # A frame finished after a newer one is not published, but still votes in the consensus.
+        instrument.count("frames.processed")
+        votes.add(deck)
+
+    camera, raw_capture = initialise()
+    frames = capture_frames(camera, raw_capture)
+    stages = pipeline.Pipeline(process, publish, worker_count, queue_depth, vote if smooth else None)
+
+    try:
+        stages.run(frames)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        frames.close()
+        camera.close()
+
+    print("Pipeline:", stages.stats)
+    return dict(stages.stats)
+
+
 if __name__ == "__main__":
     try:
         main()
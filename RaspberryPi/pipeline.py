@@ -0,0 +1,192 @@
+import queue
+import threading
+import time
+
+import instrument
+
+"""
+Pipeline parameters.
+:param workers: The default number of worker threads that process frames.
+:param depth: The default number of frames that may wait for a worker.
+"""
+workers = 4
+depth = 2
+
+
+class Pipeline:
+    def __init__(self, process, publish, worker_count=workers, queue_depth=depth, stale=None):
+        """
+        Initialises a pipeline that captures, processes and publishes frames in separate threads.
+        When the workers fall behind the oldest waiting frame is dropped, so the newest frame always gets processed.
+        OpenCV and NumPy release the GIL during the heavy work, so worker threads run on all cores.
+        :param process: Function turning a frame into a result, raising any exception to drop the frame.
+        :param publish: Function called with every result that is newer than all results published before,
+                        a result it raises an exception for is counted and skipped.
+        :param worker_count: The number of worker threads.
+        :param queue_depth: The number of frames that may wait for a worker.
+        :param stale: Function called instead of publish with every result that is older than the last published
+                      result, such as to still count it in a consensus, None to skip these results.
+        """
+        self.process = process
+        self.publish = publish
+        self.stale = stale
+        self.worker_count = worker_count
+
+        self.frames = queue.Queue(maxsize=queue_depth)
+        self.results = queue.Queue()
+        self.running = threading.Event()
+        self.threads = []
+        self.publisher = None
+        self.lock = threading.Lock()
+
+        self.stats = {
+            "captured": 0,
+            "dropped": 0,
+            "failed": 0,
+            "processed": 0,
+            "published": 0,
+            "publish_failed": 0,
+            "stale": 0,
+            "max_waiting": 0,
+        }
+
+    def count(self, name, amount=1):
+        """
+        Increases one of the pipeline statistics.
+        :param name: The name of the statistic.
+        :param amount: How much to increase it by.
+        """
+        with self.lock:
+            self.stats[name] += amount
+        instrument.count("pipeline." + name, amount)
+
+    def submit(self, frame_id, frame):
+        """
+        Queues a frame for the workers, dropping the oldest waiting frame if the queue is full.
+        :param frame_id: Increasing number of the frame.
+        :param frame: The frame.
+        """
+        self.count("captured")
+
+        while True:
+            try:
+                self.frames.put_nowait((frame_id, frame, time.perf_counter()))
+                break
+            except queue.Full:
+                try:
+                    self.frames.get_nowait()
+                    self.count("dropped")
+                except queue.Empty:
+                    pass
+
+        with self.lock:
+            self.stats["max_waiting"] = max(self.stats["max_waiting"], self.frames.qsize())
+
+    def capture(self, frames):
+        """
+        Submits all frames of a source until the source ends or the pipeline stops.
+        :param frames: An iterable of frames.
+        """
+        for frame_id, frame in enumerate(frames):
+            if not self.running.is_set():
+                break
+            self.submit(frame_id, frame)
+
+    def work(self):
+        """
+        Processes waiting frames until the pipeline stops.
+        """
+        while self.running.is_set():
+            try:
+                frame_id, frame, submitted = self.frames.get(timeout=.1)
+            except queue.Empty:
+                continue
+
+            if instrument.enabled:
+                instrument.record("pipeline.wait", time.perf_counter() - submitted)
+
+            try:
+                result = self.process(frame)
+            except Exception:
+                # A frame that cannot be processed must not stop the worker.
+                self.count("failed")
+                continue
+
+            self.count("processed")
+            self.results.put((frame_id, result, submitted))
+
+    def deliver(self):
+        """
+        Publishes processed results in order, results that are older than the last published one are not published
+        but passed to stale, if given. Stops when it receives None.
+        """
+        last = -1
+
+        while True:
+            item = self.results.get()
+            if item is None:
+                break
+
+            frame_id, result, submitted = item
+            if frame_id < last:
+                self.count("stale")
+                if self.stale is not None:
+                    try:
+                        self.stale(result)
+                    except Exception:
+                        self.count("publish_failed")
+                continue
+
+            last = frame_id
+            try:
+                self.publish(result)
+            except Exception:
+                self.count("publish_failed")
+                continue
+            self.count("published")
+
+            if instrument.enabled:
+                instrument.record("pipeline.latency", time.perf_counter() - submitted)
+
+    def start(self):
+        """
+        Starts the worker and publisher threads.
+        """
+        self.running.set()
+        self.threads = [threading.Thread(target=self.work, daemon=True) for _ in range(self.worker_count)]
+        self.publisher = threading.Thread(target=self.deliver, daemon=True)
+
+        for thread in self.threads + [self.publisher]:
+            thread.start()
+
+    def stop(self, drain=True):
+        """
+        Stops the pipeline.
+        :param drain: Whether to process the frames that are still waiting before stopping.
+        """
+        if drain:
+            # Waiting frames are only processed while a worker is still alive.
+            while not self.frames.empty() and any(thread.is_alive() for thread in self.threads):
+                time.sleep(.01)
+
+        self.running.clear()
+        for thread in self.threads:
+            thread.join()
+
+        # All results are queued once the workers stopped, let the publisher finish them.
+        self.results.put(None)
+        self.publisher.join()
+
+    def run(self, frames):
+        """
+        Runs the pipeline on a source of frames, capturing in the calling thread.
+        :param frames: An iterable of frames.
+        :return: The pipeline statistics.
+        """
+        self.start()
+        try:
+            self.capture(frames)
+        finally:
+            self.stop()
+
+        return dict(self.stats)
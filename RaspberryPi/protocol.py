@@ -0,0 +1,144 @@
+import struct
+
+import cv2
+import numpy as np
+
+"""
+Upload protocol parameters.
+:param raw_type: The content type of raw uploads.
+:param header: Layout of the header in front of raw pixels: magic, bits per pixel, channels,
+               height and width of the sent image, height and width of the original frame.
+"""
+raw_type = "application/x-deck-raw"
+header = struct.Struct("<4sBBHHHH")
+magic = b"DECK"
+
+"""
+Frame size parameters.
+:param max_side: The largest height and width an upload is grown back to, bounding the memory a frame takes.
+"""
+max_side = 4096
+
+
+def check_full_shape(full_shape, shape=None):
+    """
+    Checks that the original frame size of an upload can be grown back to.
+    :param full_shape: The (height, width) of the original frame.
+    :param shape: The shape of the sent image, which may not be larger than the original frame.
+    :raises ValueError: If the size is not positive, larger than max_side or smaller than the sent image.
+    """
+    height, width = full_shape[:2]
+    if not (0 < height <= max_side and 0 < width <= max_side):
+        raise ValueError("The frame size has to be between 1 and {} pixels.".format(max_side))
+    if shape is not None and (height < shape[0] or width < shape[1]):
+        raise ValueError("The frame size cannot be smaller than the sent image.")
+
+
+def encode_raw(image, full_shape=None, packed=False):
+    """
+    Encodes an image as raw pixels behind a small header.
+    :param image: The image, grey or BGR.
+    :param full_shape: The shape of the original frame if the image was shrunk, defaults to the shape of the image.
+    :param packed: Whether to send one bit per pixel, for images that only contain 0 and 255.
+    :return: The encoded image.
+    """
+    height, width = image.shape[:2]
+    channels = 1 if image.ndim == 2 else image.shape[2]
+    full_height, full_width = (full_shape or image.shape)[:2]
+
+    if packed:
+        assert channels == 1, "Only grey images can be packed."
+        pixels = np.packbits(image > 127, axis=1)
+    else:
+        pixels = np.ascontiguousarray(image, dtype=np.uint8)
+
+    return header.pack(magic, 1 if packed else 8, channels, height, width, full_height, full_width) + pixels.tobytes()
+
+
+def decode_raw(data):
+    """
+    Decodes an image encoded by encode_raw.
+    :param data: The encoded image.
+    :return: The image and the shape of the original frame.
+    """
+    if len(data) < header.size:
+        raise ValueError("Raw upload is too short.")
+
+    tag, bits, channels, height, width, full_height, full_width = header.unpack_from(data)
+    if tag != magic:
+        raise ValueError("Raw upload has no valid header.")
+
+    pixels = np.frombuffer(data, np.uint8, offset=header.size)
+
+    if bits == 1:
+        row_bytes = (width + 7) // 8
+        if pixels.size != height * row_bytes:
+            raise ValueError("Raw upload has the wrong size.")
+        image = np.unpackbits(pixels.reshape(height, row_bytes), axis=1)[:, :width] * np.uint8(255)
+    else:
+        if pixels.size != height * width * channels:
+            raise ValueError("Raw upload has the wrong size.")
+        image = pixels.reshape((height, width) if channels == 1 else (height, width, channels))
+
+    return image, (full_height, full_width)
+
+
+def encode_frame(image, encoding="jpeg", quality=80, gray=False, scale=1.0):
+    """
+    Encodes a camera frame for uploading.
+    :param image: The BGR frame.
+    :param encoding: One of "jpeg", "png" or "raw".
+    :param quality: The jpeg quality, from 0 to 100.
+    :param gray: Whether to send a grey image.
+    :param scale: How much to shrink the frame before sending, the server grows it back to the original size.
+    :return: The encoded frame and its content type.
+    """
+    full_shape = image.shape
+
+    if gray:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    if scale != 1:
+        image = cv2.resize(image, (0, 0), fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    if encoding == "raw":
+        return encode_raw(image, full_shape), raw_type
+
+    if encoding == "jpeg":
+        _, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    elif encoding == "png":
+        _, encoded = cv2.imencode(".png", image)
+    else:
+        raise ValueError("Unknown encoding {}.".format(encoding))
+
+    # Images do not carry the original size, it is sent as a query instead.
+    return encoded.tobytes(), "image/{}".format(encoding)
+
+
+def decode_frame(data, content_type, full_shape=None, cropped=False):
+    """
+    Decodes an uploaded image, growing it back to the original frame size.
+    :param data: The encoded image.
+    :param content_type: The content type of the upload.
+    :param full_shape: The (height, width) of the original frame for jpeg and png uploads, if it was shrunk.
+    :param cropped: Whether a grey image is wanted, as for cropped decks, instead of a BGR frame.
+                    Cropped decks are never shrunk, so their frame size is ignored.
+    :return: The decoded image.
+    :raises ValueError: If the upload is not a valid image or its frame size is not valid, see check_full_shape.
+    """
+    if content_type == raw_type:
+        image, full_shape = decode_raw(data)
+    else:
+        image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_UNCHANGED)
+        if image is None:
+            raise ValueError("Could not decode the image.")
+
+    if full_shape is not None and not cropped and image.shape[:2] != tuple(full_shape[:2]):
+        check_full_shape(full_shape, image.shape)
+        image = cv2.resize(image, (full_shape[1], full_shape[0]), interpolation=cv2.INTER_LINEAR)
+
+    if cropped and image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    elif not cropped and image.ndim == 2:
+        image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+
+    return image
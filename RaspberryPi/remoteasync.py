@@ -0,0 +1,220 @@
+import asyncio
+import itertools
+import json
+import time
+from urllib.parse import urlencode, urlsplit
+
+import cv2
+import numpy as np
+
+import line
+import remotefind
+from card import string_to_deck
+from livefeed import capture_frames, initialise
+
+"""
+Asynchronous client parameters.
+:param in_flight: The number of frames that are sent to the server at the same time.
+"""
+in_flight = 4
+
+
+class Connection:
+    def __init__(self, address):
+        """
+        Initialises a keep-alive HTTP connection to the server, connecting when the first request is sent.
+        :param address: The address of the server, as http://host:port.
+        """
+        url = urlsplit(address)
+        self.host = url.hostname
+        self.port = url.port or 80
+        self.reader = None
+        self.writer = None
+
+    async def close(self):
+        """
+        Closes the connection.
+        """
+        if self.writer is not None:
+            self.writer.close()
+            self.reader, self.writer = None, None
+
+    async def post(self, path, body, content_type, headers=None):
+        """
+        Posts a body to the server, reconnecting if the server closed the connection.
+        :param path: The path and query to post to.
+        :param body: The bytes to post.
+        :param content_type: The content type of the body.
+        :param headers: Extra request headers.
+        :return: The status code, the response headers and the response body.
+        """
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+        lines = ["POST {} HTTP/1.1".format(path),
+                 "Host: {}:{}".format(self.host, self.port),
+                 "Content-Type: {}".format(content_type),
+                 "Content-Length: {}".format(len(body)),
+                 "Connection: keep-alive"]
+        lines += ["{}: {}".format(name, value) for name, value in (headers or {}).items()]
+
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("ascii") + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("Server closed the connection.")
+        version, status = status_line.decode("ascii").split()[:2]
+
+        response_headers = {}
+        while True:
+            header_line = (await self.reader.readline()).decode("latin-1").strip()
+            if not header_line:
+                break
+            name, _, value = header_line.partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+
+        if "content-length" in response_headers:
+            response_body = await self.reader.readexactly(int(response_headers["content-length"]))
+        else:
+            response_body = await self.reader.read()
+
+        # HTTP/1.0 servers close the connection after every response unless asked otherwise.
+        keep = response_headers.get("connection", "").lower()
+        if keep == "close" or (version == "HTTP/1.0" and keep != "keep-alive"):
+            await self.close()
+
+        return int(status), response_headers, response_body
+
+
+async def send_frames(connection, address, frames, results):
+    """
+    Sends queued frames to the server over one connection until a None frame is queued.
+    :param connection: The connection to send the frames over.
+    :param address: The address of the server.
+    :param frames: Queue of (frame id, frame).
+    :param results: Queue receiving (frame id, json answer, round-trip time).
+    """
+    loop = asyncio.get_running_loop()
+    path_prefix = urlsplit(address).path.rstrip("/")
+
+    while True:
+        item = await frames.get()
+        if item is None:
+            break
+
+        frame_id, image = item
+        try:
+            data, content_type, path, params = await loop.run_in_executor(None, remotefind.encode_upload, image)
+        except (IndexError, TypeError, ValueError, cv2.error):
+            # The deck could not be cropped locally.
+            continue
+
+        if params:
+            path += "?" + urlencode(params)
+
+        start = time.perf_counter()
+        try:
+            status, _, body = await connection.post(path_prefix + path, data, content_type,
+                                                    {"X-Frame-Id": frame_id})
+            answer = json.loads(body.decode("utf-8"))
+        except (ConnectionError, asyncio.IncompleteReadError, OSError, ValueError) as e:
+            # Also covers malformed responses, such as an HTML error page, after which the connection is not reused.
+            await connection.close()
+            print("Frame {} failed: {}".format(frame_id, e))
+            continue
+
+        await results.put((answer.get("frame", frame_id), answer, time.perf_counter() - start))
+
+
+async def run(source, address, flight=in_flight, print_info=False):
+    """
+    Sends frames to the server keeping multiple requests in flight, and shows the answers in order.
+    Answers that arrive after the answer of a newer frame are dropped.
+    :param source: An iterable of frames, read in a background thread.
+    :param address: The address of the server.
+    :param flight: The number of frames that are sent at the same time.
+    :param print_info: Whether to print every deck and its accuracy.
+    :return: The number of frames sent, shown and dropped, the frames per second shown and round-trip percentiles.
+    """
+    loop = asyncio.get_running_loop()
+    frames = asyncio.Queue(maxsize=flight)
+    results = asyncio.Queue()
+    connections = [Connection(address) for _ in range(flight)]
+    senders = [asyncio.ensure_future(send_frames(c, address, frames, results)) for c in connections]
+
+    stats = {"sent": 0, "shown": 0, "stale": 0}
+    rtts = []
+    start = time.perf_counter()
+
+    async def show():
+        last = -1
+        while True:
+            item = await results.get()
+            if item is None:
+                break
+
+            frame_id, answer, rtt = item
+            rtts.append(rtt)
+            if frame_id < last:
+                stats["stale"] += 1
+                continue
+
+            last = frame_id
+            stats["shown"] += 1
+            if print_info and "data" in answer:
+                deck = string_to_deck(answer["data"])
+                print("Frame {}: {}".format(frame_id, ", ".join([str(c) for c in deck])))
+                print("Accuracy: {:.2f}%".format(line.accuracy_score(deck)))
+
+    shower = asyncio.ensure_future(show())
+
+    iterator = iter(source)
+    stop = object()
+    frame_id = 0
+    while True:
+        image = await loop.run_in_executor(None, next, iterator, stop)
+        if image is stop:
+            break
+
+        await frames.put((frame_id, image))
+        stats["sent"] += 1
+        frame_id += 1
+
+    for _ in senders:
+        await frames.put(None)
+    await asyncio.gather(*senders)
+    await results.put(None)
+    await shower
+
+    for connection in connections:
+        await connection.close()
+
+    elapsed = time.perf_counter() - start
+    stats["fps"] = stats["shown"] / elapsed if elapsed > 0 else 0.0
+    if rtts:
+        stats.update({"rtt_p{}".format(p): float(np.percentile(rtts, p)) * 1000 for p in (50, 95, 99)})
+
+    return stats
+
+
+def main(print_info=False, address="http://145.116.146.92:9002", flight=in_flight, limit=1000):
+    """
+    Sends the PI camera feed to the server with multiple frames in flight and prints the achieved
+    frames per second and round-trip times.
+    :param print_info: Whether to print every deck and its accuracy.
+    :param address: The IP address (and port) of the remote server.
+    :param flight: The number of frames that are sent at the same time.
+    :param limit: The number of frames to send.
+    """
+    camera, raw_capture = initialise()
+    frames = itertools.islice(capture_frames(camera, raw_capture), limit)
+
+    try:
+        print(asyncio.run(run(frames, address, flight, print_info)))
+    finally:
+        camera.close()
+
+
+if __name__ == "__main__":
+    main()
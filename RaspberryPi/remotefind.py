@@ -1,42 +1,98 @@
-from glob import glob
+import time
 
 import cv2
 import requests
 
+import finddeck
 import line
-from livefeed import initialise
+import protocol
+from card import string_to_deck
+from livefeed import capture_frames, initialise
 
+"""
+Upload parameters.
+:param encoding: How frames are encoded, one of "jpeg", "png" or "raw".
+:param quality: The jpeg quality, from 0 to 100.
+:param gray: Whether to send grey frames.
+:param scale: How much to shrink frames before sending.
+:param crop: Whether to locate and crop the deck locally and only send the bit packed 300x300 deck.
+"""
+encoding = "jpeg"
+quality = 80
+gray = True
+scale = .5
+crop = False
 
-def get_server_answer(image, address):
+
+def encode_upload(image):
+    """
+    Encodes a camera frame according to the upload parameters.
+    :param image: The image from the camera.
+    :return: The encoded image, its content type, the server path and the query parameters.
+    """
+    if crop:
+        _, _, _, box = finddeck.compute_bounds(image)
+        cropped = finddeck.crop_deck(image, box)
+        return protocol.encode_raw(cropped, packed=True), protocol.raw_type, "/cropped", {}
+
+    data, content_type = protocol.encode_frame(image, encoding, quality, gray, scale)
+    height, width = image.shape[:2]
+    return data, content_type, "/frame", {"height": height, "width": width}
+
+
+def get_server_answer(image, address, session=None):
     """
-    ...
+    Sends a frame to the server and waits for the cards it finds.
     :param image: The image from the camera.
-    :return: A json response containing the found codes by the server.
+    :param address: The address of the server.
+    :param session: The session to reuse the connection of, a new connection is made if None.
+    :return: A json response containing the found codes by the server, the number of bytes sent and the round-trip time.
     """
-    content_type = "image/jpeg"
+    data, content_type, path, params = encode_upload(image)
     headers = {"content-type": content_type}
-    _, encoded = cv2.imencode(".png", image)
 
-    r = requests.post(address, data=encoded.tostring(), headers=headers)
+    start = time.perf_counter()
+    r = (session or requests).post(address.rstrip("/") + path, data=data, params=params, headers=headers)
+    rtt = time.perf_counter() - start
 
-    return r.json()
+    return r.json(), len(data), rtt
 
 
 def main(print_info=False, address="http://145.116.146.92:9002"):
     """
     This function tests the server's response to the PI camera feed. Each frame
-    is sent to the server and the response and its accuracy are printed. 
+    is sent to the server and the response and its accuracy are printed,
+    together with the bytes sent and the round-trip time.
     :param address: The IP address (and port) of the remote server.
     """
     camera, raw_capture = initialise()
+    session = requests.Session()
+
+    frames = 0
+    total_bytes = 0
+    total_rtt = 0
 
     # Capture frames from the camera.
-    for frame in camera.capture_continuous(raw_capture, format='bgr', use_video_port=True):
-        image = frame.array.copy()
-        deck = get_server_answer(image, address)
+    for image in capture_frames(camera, raw_capture):
+        try:
+            answer, size, rtt = get_server_answer(image, address, session)
+        except (IndexError, TypeError, ValueError, cv2.error):
+            # The deck could not be cropped locally, or the answer was not valid json.
+            continue
+
+        frames += 1
+        total_bytes += size
+        total_rtt += rtt
+
+        if "data" in answer:
+            deck = string_to_deck(answer["data"])
+            print(", ".join([str(c) for c in deck]))
+            print("Accuracy: {:.2f}%".format(line.accuracy_score(deck)))
+        else:
+            print("Error:", answer.get("error"))
 
-        print(", ".join([c for c in deck]))
-        print("Accuracy: {:.2f}%".format(line.accuracy_score(deck)))
+        print("Sent {} bytes, round trip {:.1f}ms (average {:.0f} bytes, {:.1f}ms)".format(
+            size, rtt * 1000, total_bytes / frames, total_rtt / frames * 1000))
 
         # Break from the loop if the q key was pressed.
         if cv2.waitKey(1) == ord("q"):
@@ -0,0 +1,169 @@
+import time
+
+import numpy as np
+
+from card import codes_old
+
+"""
+Synthetic deck parameters, ranges are sampled uniformly per deck.
+:param size: The height and width of a generated deck, as produced by finddeck.crop_deck.
+:param unit_range: The width of a code unit in pixels.
+:param offset_range: The distance from the left side to the start of the codes in pixels.
+:param skew_range: The horizontal shift of the codes per line in pixels, for decks that are not cut straight.
+:param blur_range: The standard deviation of the blur in pixels, 0 for none.
+:param noise_range: The standard deviation of the noise added before thresholding, relative to white.
+:param speckle: The fraction of pixels flipped after thresholding.
+:param chunk: The number of decks generated at once, bounding the memory used.
+"""
+size = 300
+unit_range = (13., 16.)
+offset_range = (2., 20.)
+skew_range = (-.03, .03)
+blur_range = (0., 1.5)
+noise_range = (0., .3)
+speckle = .002
+chunk = 64
+
+"""
+Layout of a line in thirds of a code unit: a black, white, black start triplet and a spacer,
+followed by the four codes of two units each with a spacer behind every code, as in generateperfect.
+"""
+thirds = 3
+spacer = 4
+
+
+def build_patterns(codes):
+    """
+    Builds the black and white pattern of the line of every card.
+    :param codes: The codes of all cards as bitstrings of the form xx xx xx xx, a one is black.
+    :return: An array with a row per card of whether each third of a unit is black.
+    """
+    start = [1] * thirds + [0] * thirds + [1] * thirds + [0] * spacer
+    patterns = []
+
+    for code in codes:
+        pattern = list(start)
+        for symbol in code.split():
+            for bit in symbol:
+                pattern += [int(bit)] * thirds
+            pattern += [0] * spacer
+        patterns.append(pattern)
+
+    return np.array(patterns, dtype=bool)
+
+
+def blur(images, sigma):
+    """
+    Blurs a batch of images with a separable Gaussian kernel, each image with its own strength.
+    :param images: Array of float images.
+    :param sigma: The standard deviation of the blur per image.
+    :return: The blurred images.
+    """
+    radius = int(np.ceil(3 * max(sigma.max(), 1e-6)))
+    offsets = np.arange(-radius, radius + 1)
+    kernels = np.exp(-.5 * (offsets[None, :] / np.maximum(sigma[:, None], 1e-6)) ** 2)
+    kernels = (kernels / kernels.sum(axis=1, keepdims=True)).astype(images.dtype)
+
+    for axis in (1, 2):
+        padded = np.pad(images, [(0, 0)] + [(radius, radius) if a == axis else (0, 0) for a in (1, 2)], mode="edge")
+        length = images.shape[axis]
+        images = sum(kernels[:, i, None, None] * padded.take(np.arange(i, i + length), axis=axis)
+                     for i in range(len(offsets)))
+
+    return images
+
+
+def generate_decks(count, rng=None, orders=None, patterns=None):
+    """
+    Generates cropped and thresholded images of marked decks.
+    :param count: The number of decks.
+    :param rng: The numpy random generator, a new one if None.
+    :param orders: The order of the cards per deck, shuffled if None.
+    :param patterns: The line pattern of every card, see build_patterns, defaults to the previous version codes.
+    :return: The images with 255 for white and 0 for black, and the order of the cards per deck.
+    """
+    rng = rng or np.random.default_rng()
+    patterns = default_patterns if patterns is None else patterns
+
+    if orders is None:
+        orders = np.argsort(rng.random((count, 52)), axis=1)
+    orders = np.asarray(orders, dtype=np.int64)
+
+    unit = rng.uniform(*unit_range, count)
+    offset = rng.uniform(*offset_range, count)
+    skew = rng.uniform(*skew_range, count)
+    sigma = rng.uniform(*blur_range, count)
+    noise = rng.uniform(*noise_range, count)
+
+    rows = np.arange(size)
+    cols = np.arange(size)
+
+    # Every card covers an equal band of lines.
+    positions = rows * 52 // size
+    cards = orders[:, positions]
+
+    # The third of a unit every pixel falls in, outside the pattern is white.
+    x = cols[None, None, :] - offset[:, None, None] - skew[:, None, None] * rows[None, :, None]
+    cell = np.floor(x / unit[:, None, None] * thirds).astype(np.int64)
+    inside = (cell >= 0) & (cell < patterns.shape[1])
+    black = inside & patterns[cards[:, :, None], np.clip(cell, 0, patterns.shape[1] - 1)]
+
+    images = np.where(black, np.float32(0), np.float32(1))
+    if sigma.max() > 0:
+        images = blur(images, sigma)
+    images += rng.standard_normal(images.shape, dtype=np.float32) * noise[:, None, None].astype(np.float32)
+
+    thresholded = images > .5
+    thresholded ^= rng.random(thresholded.shape) < speckle
+
+    return thresholded.astype(np.uint8) * np.uint8(255), orders
+
+
+def write_archive(path="Synthetic.npz", count=1000, seed=0):
+    """
+    Generates decks in bulk and packs them into one archive, in the format of dataset.pack_directory
+    with the order of the cards per deck added.
+    :param path: The path of the archive to write.
+    :param count: The number of decks.
+    :param seed: The seed of the random generator, for reproducible archives.
+    :return: The number of decks generated per second.
+    """
+    rng = np.random.default_rng(seed)
+    packed = np.empty((count, size, (size + 7) // 8), dtype=np.uint8)
+    orders = np.empty((count, 52), dtype=np.uint8)
+
+    start = time.perf_counter()
+    for first in range(0, count, chunk):
+        images, chunk_orders = generate_decks(min(chunk, count - first), rng)
+        packed[first:first + len(images)] = np.packbits(images > 127, axis=2)
+        orders[first:first + len(images)] = chunk_orders
+    elapsed = time.perf_counter() - start
+
+    np.savez_compressed(path,
+                        names=np.array(["{:06d}".format(i) for i in range(count)]),
+                        packed=packed,
+                        width=size,
+                        orders=orders)
+
+    return count / elapsed if elapsed > 0 else 0.0
+
+
+def load_orders(path="Synthetic.npz"):
+    """
+    Loads the order of the cards per deck from an archive written by write_archive.
+    The decks themselves are loaded with dataset.load_packed.
+    :param path: The path of the archive.
+    :return: The order of the cards per deck.
+    """
+    with np.load(path) as archive:
+        return archive["orders"]
+
+
+"""
+The line patterns of the previous version codes, which line decodes.
+"""
+default_patterns = build_patterns(codes_old)
+
+
+if __name__ == "__main__":
+    print("Generated {:.0f} decks per second.".format(write_archive()))
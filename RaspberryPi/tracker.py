@@ -0,0 +1,119 @@
+import cv2
+import numpy as np
+
+import finddeck
+import instrument
+
+"""
+Tracker parameters.
+:param scale: The scale at which frames are compared to the last detection.
+:param max_difference: The maximum mean absolute grey level difference inside the box to keep the last detection.
+:param max_age: The maximum number of frames to reuse a detection before detecting the deck again.
+"""
+scale = .125
+max_difference = 3
+max_age = 30
+
+
+class Tracker:
+    def __init__(self):
+        """
+        Initialises a tracker without any detection.
+        """
+        self.bounds = None
+        self.reference = None
+        self.age = 0
+
+    def reset(self):
+        """
+        Forgets the last detection, such that the next frame is detected from scratch.
+        """
+        self.bounds = None
+        self.reference = None
+        self.age = 0
+
+    def thumbnail(self, image):
+        """
+        Shrinks a frame to a small grey image that is cheap to compare.
+        :param image: The frame.
+        :return: The small grey image.
+        """
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        return cv2.resize(gray, (0, 0), fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    def unchanged(self, thumbnail):
+        """
+        Checks whether the deck area looks the same as in the frame of the last detection.
+        :param thumbnail: The small grey image of the current frame.
+        :return: True if the last detection can be reused.
+        """
+        if self.bounds is None or self.age >= max_age or thumbnail.shape != self.reference.shape:
+            return False
+
+        box = self.bounds[3]
+        x, y, w, h = cv2.boundingRect((box * scale).astype(np.int32))
+        x, y = max(x, 0), max(y, 0)
+
+        current = thumbnail[y:y + h, x:x + w]
+        previous = self.reference[y:y + h, x:x + w]
+        if current.size == 0:
+            return False
+
+        return cv2.absdiff(current, previous).mean() <= max_difference
+
+    def detect(self, image):
+        """
+        Detects the deck, searching around the last detection first if there is one.
+        :param image: The frame.
+        :return: The corners, left box, right box and box of the deck, as in finddeck.compute_bounds.
+        """
+        if self.bounds is not None:
+            roi = finddeck.roi_from_box(self.bounds[3])
+            try:
+                bounds = finddeck.compute_bounds(image, roi=roi)
+                if self.inside(bounds[3], roi):
+                    return bounds
+            except (IndexError, TypeError, ValueError, cv2.error):
+                pass
+
+        # The deck left the region of interest, search the whole frame.
+        return finddeck.compute_bounds(image)
+
+    @staticmethod
+    def inside(box, roi):
+        """
+        Checks whether a box lies well within a region of interest, such that the deck was not cut off by it.
+        :param box: The box found within the padded region of interest.
+        :param roi: The region of interest before padding, as (x, y, width, height).
+        :return: True if the box stays within half the padding around the region of interest.
+        """
+        x, y, w, h = roi
+        margin_x, margin_y = w * finddeck.roi_padding / 2, h * finddeck.roi_padding / 2
+
+        return (np.all(box[:, 0] >= x - margin_x) and np.all(box[:, 0] <= x + w + margin_x) and
+                np.all(box[:, 1] >= y - margin_y) and np.all(box[:, 1] <= y + h + margin_y))
+
+    def update(self, image):
+        """
+        Finds the deck in a frame, reusing the last detection if the deck did not move.
+        :param image: The frame.
+        :return: The corners, left box, right box and box of the deck, as in finddeck.compute_bounds.
+        """
+        thumbnail = self.thumbnail(image)
+
+        if self.unchanged(thumbnail):
+            self.age += 1
+            instrument.count("tracker.reused")
+            return self.bounds
+
+        try:
+            self.bounds = self.detect(image)
+        except (IndexError, TypeError, ValueError, cv2.error):
+            self.reset()
+            raise
+
+        self.reference = thumbnail
+        self.age = 0
+        instrument.count("tracker.detected")
+
+        return self.bounds
@@ -1,34 +1,230 @@
 import json
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
 
 import cv2
-import numpy as np
 from flask import Flask, request
 
+import finddeck
+import instrument
+import protocol
+from card import deck_to_string
 from line import get_filtered_deck
 
 app = Flask(__name__)
 
+"""
+Serving parameters.
+:param workers: The number of processes decoding images.
+:param max_pending: The maximum number of requests being decoded or waiting, others are refused with 503.
+"""
+workers = os.cpu_count() or 1
+max_pending = 2 * workers
+
+pool = None
+pending = threading.BoundedSemaphore(max_pending)
+stats = {"pending": 0, "completed": 0, "rejected": 0, "failed": 0}
+stats_lock = threading.Lock()
+
+
+def count(name, amount=1):
+    """
+    Increases one of the serving statistics.
+    :param name: The name of the statistic.
+    :param amount: How much to increase it by.
+    """
+    with stats_lock:
+        stats[name] += amount
+
+
+def decode_deck(data, content_type=None, full_shape=None, cropped=False):
+    """
+    Decodes an image and finds the cards in it.
+    Runs in a worker process.
+    :param data: The encoded image.
+    :param content_type: The content type of the upload, see protocol.
+    :param full_shape: The (height, width) of the original frame if the client shrunk it.
+    :param cropped: Whether the image is already cropped and thresholded, otherwise the deck is located first.
+    :return: The found deck, or None if no deck was found in the image.
+    :raises ValueError: If the upload is not a valid image.
+    """
+    try:
+        image = protocol.decode_frame(data, content_type, full_shape, cropped)
+    except cv2.error as e:
+        raise ValueError("Could not decode the image: {}".format(e))
+
+    try:
+        if not cropped:
+            _, _, _, box = finddeck.compute_bounds(image)
+            image = finddeck.crop_deck(image, box)
+
+        return get_filtered_deck(image)
+    except (IndexError, TypeError, ValueError, cv2.error):
+        # No deck could be located or decoded in a valid image.
+        return None
+
+
+def run_task(function, *args):
+    """
+    Runs a function in the worker pool, or directly if there is no pool.
+    What the function records in a worker is merged into the instrumentation of this process.
+    :param function: The function to run.
+    :param args: The arguments of the function.
+    :return: The result of the function.
+    """
+    if pool is None:
+        return function(*args)
+
+    if not instrument.enabled:
+        return pool.submit(function, *args).result()
+
+    result, recorded, error = pool.submit(instrument.collect, function, *args).result()
+    instrument.merge(recorded)
+    if error is not None:
+        raise error
+
+    return result
+
+
+def json_response(data, status=200):
+    """
+    Builds a json response.
+    :param data: The data to encode.
+    :param status: The HTTP status code.
+    :return: The HTTP response.
+    """
+    return app.response_class(response=json.dumps(data), status=status, mimetype="application/json")
+
+
+def answer(cropped):
+    """
+    Finds the cards in the uploaded image of the current request and builds the response.
+    The original frame size of shrunk jpeg and png uploads is given by the height and width query parameters,
+    which are ignored for cropped images.
+    :param cropped: Whether the image is already cropped and thresholded.
+    :return: HTTP response containing json encoded card codes.
+    """
+    full_shape = None
+    if not cropped and "height" in request.args and "width" in request.args:
+        try:
+            full_shape = int(request.args["height"]), int(request.args["width"])
+        except ValueError:
+            return json_response({"error": "The height and width parameters have to be integers."}, status=400)
+
+        try:
+            protocol.check_full_shape(full_shape)
+        except ValueError as e:
+            return json_response({"error": str(e)}, status=400)
+
+    frame_id = None
+    if "X-Frame-Id" in request.headers:
+        try:
+            frame_id = int(request.headers["X-Frame-Id"])
+        except ValueError:
+            return json_response({"error": "The X-Frame-Id header has to be an integer."}, status=400)
+
+    if not pending.acquire(blocking=False):
+        count("rejected")
+        return json_response({"error": "Too many pending requests."}, status=503)
+
+    count("pending")
+    try:
+        deck = run_task(decode_deck, request.get_data(), request.content_type, full_shape, cropped)
+        count("completed")
+    except ValueError as e:
+        count("failed")
+        return json_response({"error": str(e)}, status=400)
+    except Exception as e:
+        count("failed")
+        return json_response({"error": repr(e)}, status=500)
+    finally:
+        count("pending", -1)
+        pending.release()
+
+    if deck is None:
+        return json_response({"error": "No deck found in the image."}, status=422)
+
+    # Build a response dict to send back to client, echoing the frame id of pipelining clients.
+    answer_json = {"deck": [str(c) for c in deck], "data": deck_to_string(deck)}
+    if frame_id is not None:
+        answer_json["frame"] = frame_id
+
+    return json_response(answer_json)
+
 
 @app.route("/", methods=["GET", "POST"])
+@app.route("/frame", methods=["POST"])
+@instrument.timed("webserver.main")
 def main():
     """
-    Receive an image through an HTTP request, decode it and respond with the
-    cards found in the image.
+    Receive a camera frame through an HTTP request, locate and crop the deck in it,
+    decode it and respond with the cards found in the image.
     :return: HTTP response containing json encoded card codes.
     """
-    r = request
+    return answer(cropped=False)
+
+
+@app.route("/cropped", methods=["POST"])
+@instrument.timed("webserver.cropped")
+def cropped():
+    """
+    Receive an image of a deck that is already cropped and thresholded, as by finddeck.crop_deck,
+    decode it and respond with the cards found in the image.
+    :return: HTTP response containing json encoded card codes.
+    """
+    return answer(cropped=True)
+
+
+@app.route("/health", methods=["GET"])
+def health():
+    """
+    Reports whether the server is able to take requests.
+    :return: HTTP response containing the status and the number of pending requests.
+    """
+    with stats_lock:
+        busy = stats["pending"] >= max_pending
+
+    return json_response({"status": "busy" if busy else "ok", "workers": workers, "pending": stats["pending"]})
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """
+    Reports the serving statistics and instrumentation of this server, including what its workers recorded.
+    The instrumentation is empty unless it is enabled with DECK_INSTRUMENT=1.
+    :return: HTTP response containing the statistics.
+    """
+    with stats_lock:
+        serving = dict(stats)
+
+    return json_response({"serving": serving, "max_pending": max_pending, "instrument": instrument.snapshot()})
+
+
+def serve(host="0.0.0.0", port=9002, worker_count=workers, pending_limit=None):
+    """
+    Serves requests on multiple threads, decoding images in a pool of worker processes.
+    :param host: The address to listen on.
+    :param port: The port to listen on.
+    :param worker_count: The number of worker processes, 0 to decode on the request threads.
+    :param pending_limit: The maximum number of pending requests, defaults to twice the number of workers.
+    """
+    global pool, workers, max_pending, pending
 
-    # Convert string of image data to uint8.
-    np_arr = np.fromstring(r.data, np.uint8)
+    workers = worker_count
+    max_pending = pending_limit or 2 * max(worker_count, 1)
+    pending = threading.BoundedSemaphore(max_pending)
 
-    # Decode image
-    image = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+    if worker_count > 0:
+        pool = ProcessPoolExecutor(worker_count, initializer=instrument.enable, initargs=(instrument.enabled,))
 
-    deck = get_filtered_deck(image)
-    deck_strings = [str(c) for c in deck]
+    try:
+        app.run(host=host, port=port, threaded=True)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+            pool = None
 
-    # Build a response dict to send back to client.
-    json_dump = json.dumps({"deck": deck_strings})
-    response = app.response_class(response=json_dump, status=200, mimetype="application/json")
 
-    return response
+if __name__ == "__main__":
+    serve()